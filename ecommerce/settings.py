@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 import dj_database_url
 from dotenv import load_dotenv
@@ -50,8 +51,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'shop.middleware.StaticFilesMiddleware',
+    'shop.middleware.RequestTimingMiddleware',
+    'shop.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'shop.middleware.SessionRefreshMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -103,6 +107,98 @@ else:
         }
     }
 
+# Pooled connections for PostgreSQL (psycopg 3, see shop.backends.postgresql_pool).
+# Each worker process keeps DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections and
+# lends one to each request, instead of one persistent connection per thread.
+DB_POOL = os.getenv('DB_POOL', 'False').lower() == 'true'
+DB_PREPARE_CATALOG_QUERIES = os.getenv('DB_PREPARE_CATALOG_QUERIES', 'False').lower() == 'true'
+
+
+def pooled(database):
+    if database['ENGINE'] != 'django.db.backends.postgresql' or not DB_POOL:
+        return database
+    database['ENGINE'] = 'shop.backends.postgresql_pool'
+    # Connections go back to the pool at the end of every request
+    database['CONN_MAX_AGE'] = 0
+    database['CONN_HEALTH_CHECKS'] = False
+    database.setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        # Recycle connections after this long, and close idle extras
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+    }
+    # Behind PgBouncer (e.g. Neon's -pooler host) this needs PgBouncer 1.21+
+    # with max_prepared_statements set
+    database['OPTIONS']['prepare_catalog_queries'] = DB_PREPARE_CATALOG_QUERIES
+    return database
+
+
+DATABASES['default'] = pooled(DATABASES['default'])
+
+# Optional read replica for catalog reads (see shop.routers). To try it
+# locally, point DATABASE_REPLICA_URL at a copy of the SQLite database.
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASES['replica'] = pooled(DATABASES['replica'])
+    DATABASE_ROUTERS = ['shop.routers.CatalogReplicaRouter']
+
+# Seconds a visitor reads from the primary after their own writes
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+# Seconds an unreachable replica is skipped before it is tried again
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Local memory by default. Set CACHE_URL to share the cache between workers,
+# e.g. redis://host:6379/0 or file:///var/tmp/django_cache
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('file://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_URL[len('file://'):],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ecommerce',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Seconds before a cached catalog entry is rebuilt; catalog edits invalidate it immediately
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+
+# Conditional GET for catalog pages (see shop.conditional). Pages without
+# anything of the visitor in them are public: a CDN keeps them this long and
+# serves a stale copy while it revalidates. The CDN must bypass its cache for
+# requests with a session cookie if it ignores Vary: Cookie.
+CATALOG_CDN_MAX_AGE = int(os.getenv('CATALOG_CDN_MAX_AGE', '60'))
+CATALOG_CDN_STALE_WHILE_REVALIDATE = int(os.getenv('CATALOG_CDN_STALE_WHILE_REVALIDATE', '60'))
+# Identifies the deployed code in page ETags, so new templates are never
+# answered with a 304 for a page rendered by the old ones
+RELEASE = os.getenv('RELEASE', os.getenv('RENDER_GIT_COMMIT', ''))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -142,21 +238,84 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 STATICFILES_DIRS = [
+    # css/shop.css, built from assets/css by `manage.py build_css`
     BASE_DIR / 'static',
 ]
 
+# Without DEBUG, collectstatic writes content-hashed copies of every file
+# plus .gz and .br variants; the hashed names are served with a year-long
+# immutable Cache-Control (see shop.middleware.StaticFilesMiddleware).
+# {% static %} then needs the manifest collectstatic writes, so DEBUG and
+# test runs, which skip collectstatic, keep the files' own names. Any other
+# DEBUG=False run must run collectstatic first.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG or TESTING
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
 # Media files
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+# Point at a persistent disk in production: product image variants live here
+MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', BASE_DIR / 'media'))
+
+# Product image variants (see shop.images): JPEG and WebP copies of every
+# product image at these widths, never wider than the original
+PRODUCT_IMAGE_WIDTHS = [96, 192, 384, 768, 1200]
+PRODUCT_IMAGE_QUALITY = int(os.getenv('PRODUCT_IMAGE_QUALITY', '80'))
+PRODUCT_IMAGE_MAX_BYTES = int(os.getenv('PRODUCT_IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+PRODUCT_IMAGE_FETCH_TIMEOUT = int(os.getenv('PRODUCT_IMAGE_FETCH_TIMEOUT', '15'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Per-request SQL/template timing in a Server-Timing header and the
+# 'shop.timing' log (see shop.middleware.RequestTimingMiddleware)
+REQUEST_TIMING_ENABLED = os.getenv('REQUEST_TIMING', 'False').lower() == 'true'
+REQUEST_TIMING_SLOW_MS = int(os.getenv('REQUEST_TIMING_SLOW_MS', '500'))
+
+# 'wsgi' serves ecommerce.wsgi with sync workers; 'asgi' serves ecommerce.asgi
+# with uvicorn workers and routes the catalog pages to shop.async_views
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+# Benchmarking only: sleep this long in every SQL query to imitate a distant
+# database (see manage.py bench_async)
+BENCH_DB_LATENCY_MS = float(os.getenv('BENCH_DB_LATENCY_MS', '0'))
+
 # Session configuration
+# Sessions are read from the cache and only written to the database when they change
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
 SESSION_COOKIE_AGE = 86400  # 24 hours
-SESSION_SAVE_EVERY_REQUEST = True
+# Instead of saving on every request, extend an unchanged session only when
+# less than this many seconds of it remain (see shop.middleware)
+SESSION_REFRESH_THRESHOLD = int(os.getenv('SESSION_REFRESH_THRESHOLD', '43200'))  # 12 hours
+SESSION_STATS_LOG_EVERY = 1000
+
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'shop': {
+            'handlers': ['console'],
+            'level': os.getenv('SHOP_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
 
 # Authentication URLs
 LOGIN_URL = '/login/'
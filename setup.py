@@ -275,7 +275,7 @@ def main():
 
     print("\nTo connect Neon PostgreSQL:")
     print("   1. Update DATABASE_URL in .env file")
-    print("   2. Install: pip install psycopg2-binary")
+    print("   2. Install: pip install \"psycopg[binary,pool]\"")
     print("   3. Run: python manage.py migrate")
 
     print("\nEnjoy your new e-commerce store!")
@@ -1,10 +1,21 @@
-from django.contrib import admin
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from decimal import Decimal
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+from django.db.models import DecimalField, F, Sum
+from .models import CENTS, Category, Product, Cart, CartItem, Order, OrderItem
+from .bulk import update_products
+from .export import streaming_export
+from .forms import ProductBulkUpdateForm
+from .images import current_variants, queue_product_variants
+from .pagination import EstimatedCountPaginator
+from .search import search_products
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'created_at']
+    list_display = ['name', 'slug', 'product_count', 'available_count', 'created_at']
     prepopulated_fields = {'slug': ('name',)}
     list_filter = ['created_at']
     search_fields = ['name']
@@ -15,22 +26,123 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'price', 'stock', 'available', 'featured', 'created_at']
     list_filter = ['available', 'featured', 'category', 'created_at']
     list_editable = ['price', 'stock', 'available', 'featured']
+    list_select_related = ['category']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'description']
+    autocomplete_fields = ['category']
     ordering = ['-created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [
+        'bulk_update', 'make_available', 'make_unavailable', 'make_featured', 'make_not_featured',
+        'export_csv', 'export_jsonl',
+    ]
+
+    @admin.action(description='Bulk edit price, stock and flags of selected products', permissions=['change'])
+    def bulk_update(self, request, queryset):
+        form = ProductBulkUpdateForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            count = update_products(queryset, **form.get_changes())
+            self.message_user(request, f'Updated {count} products.', messages.SUCCESS)
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Bulk edit products',
+            'opts': self.model._meta,
+            'form': form,
+            'count': queryset.count(),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+        }
+        return TemplateResponse(request, 'admin/shop/product/bulk_update.html', context)
+
+    def _set_flags(self, request, queryset, **flags):
+        count = update_products(queryset, **flags)
+        self.message_user(request, f'Updated {count} products.', messages.SUCCESS)
+
+    @admin.action(description='Mark selected products available', permissions=['change'])
+    def make_available(self, request, queryset):
+        self._set_flags(request, queryset, available=True)
+
+    @admin.action(description='Mark selected products unavailable', permissions=['change'])
+    def make_unavailable(self, request, queryset):
+        self._set_flags(request, queryset, available=False)
+
+    @admin.action(description='Feature selected products', permissions=['change'])
+    def make_featured(self, request, queryset):
+        self._set_flags(request, queryset, featured=True)
+
+    @admin.action(description='Stop featuring selected products', permissions=['change'])
+    def make_not_featured(self, request, queryset):
+        self._set_flags(request, queryset, featured=False)
+
+    @admin.action(description='Export selected products as CSV')
+    def export_csv(self, request, queryset):
+        return streaming_export('products', queryset, 'csv')
+
+    @admin.action(description='Export selected products as JSONL')
+    def export_jsonl(self, request, queryset):
+        return streaming_export('products', queryset, 'jsonl')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.image and current_variants(obj) is None:
+            queue_product_variants(obj.pk)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of ILIKE scans over description
+        if not search_term.strip():
+            return queryset, False
+        return search_products(queryset, search_term), False
 
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'total_items', 'total_price', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['user']
     readonly_fields = ['total_items', 'total_price']
+    raw_id_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _total_items=Sum('items__quantity'),
+            _total_price=Sum(
+                F('items__quantity') * F('items__product__price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
+    @admin.display(description='Total items', ordering='_total_items')
+    def total_items(self, obj):
+        return obj._total_items or 0
+
+    @admin.display(description='Total price', ordering='_total_price')
+    def total_price(self, obj):
+        # SQLite sums the line totals in floating point
+        return (obj._total_price or Decimal('0')).quantize(CENTS)
 
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'get_total_price', 'created_at']
     list_filter = ['created_at']
+    raw_id_fields = ['cart']
+    autocomplete_fields = ['product']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Product for __str__ and the line total, which comes from the annotation
+        return super().get_queryset(request).with_line_totals().select_related('cart')
+
+    @admin.display(description='Total price', ordering='line_total')
+    def get_total_price(self, obj):
+        return obj.get_total_price()
 
 
 @admin.register(Order)
@@ -38,10 +150,28 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'status', 'total_amount', 'created_at']
     list_filter = ['status', 'created_at']
     list_editable = ['status']
+    list_select_related = ['user']
     readonly_fields = ['total_amount', 'created_at', 'updated_at']
     search_fields = ['user__username', 'user__email']
+    raw_id_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['export_csv', 'export_jsonl']
+
+    @admin.action(description='Export selected orders with their lines as CSV')
+    def export_csv(self, request, queryset):
+        return streaming_export('orders', queryset, 'csv')
+
+    @admin.action(description='Export selected orders with their lines as JSONL')
+    def export_jsonl(self, request, queryset):
+        return streaming_export('orders', queryset, 'jsonl')
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ['order', 'product', 'quantity', 'price', 'get_total_price']
\ No newline at end of file
+    list_display = ['order', 'product', 'quantity', 'price', 'get_total_price']
+    list_select_related = ['order', 'product']
+    raw_id_fields = ['order']
+    autocomplete_fields = ['product']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
\ No newline at end of file
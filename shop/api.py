@@ -0,0 +1,288 @@
+"""
+JSON API: a read-only catalog and the visitor's cart.
+
+Catalog responses are built from ``.values()`` rows, so no model instances
+are created, and are cached like the HTML pages under the catalog version.
+``?fields=id,name,price`` picks a subset of a resource's fields. Product
+listings page with the keyset cursors of the HTML list (``next`` and
+``previous`` links), and carry the same ETags and CDN caching as the catalog
+pages (see shop.conditional), minus the per-visitor part.
+
+The cart endpoints use the session like the storefront: clients keep the
+cookies, and send the csrftoken cookie back in an X-CSRFToken header on
+writes. GET /api/cart/ sets that cookie.
+"""
+import json
+from decimal import Decimal
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from .cart import CENTS, add_item, get_cart, remove_item
+from .catalog_cache import get_or_build
+from .conditional import conditional_page, listing_validator, product_validator
+from .forms import CartAddProductForm
+from .models import Category, Product
+from .pagination import KeysetPaginator, normalize_cursor
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# API field -> ORM lookup; 'url' is built from the slug
+CATEGORY_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'description': 'description',
+    'updated_at': 'updated_at',
+    'url': 'slug',
+}
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'category': 'category__slug',
+    'price': 'price',
+    'stock': 'stock',
+    'available': 'available',
+    'featured': 'featured',
+    'image': 'image',
+    'description': 'description',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'url': 'slug',
+}
+# Listings leave out the long text unless asked for
+PRODUCT_LIST_FIELDS = ['id', 'name', 'slug', 'category', 'price', 'image', 'available', 'url']
+
+
+class ApiError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')})
+
+
+def error_response(error):
+    return json_response({'error': str(error)}, status=error.status)
+
+
+def api_view(view):
+    """Turn an ApiError raised by view into a JSON error response"""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return error_response(e)
+    return inner
+
+
+def parse_fields(request, available, default):
+    value = request.GET.get('fields', '')
+    if not value:
+        return list(default)
+    fields = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(available)}")
+    # In a fixed order: fields go into cache keys, and the order asked for
+    # would otherwise make an entry per permutation
+    return [name for name in available if name in fields]
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+def parse_cursor(request):
+    """The normalized ?cursor=, so that it keys the cache by its position only"""
+    token = request.GET.get('cursor')
+    if not token:
+        return None
+    cursor = normalize_cursor(token)
+    if cursor is None:
+        raise ApiError('cursor is not valid; use the next or previous link of a listing')
+    return cursor
+
+
+def serialize(rows, fields, columns, url_name):
+    """Rename .values() rows to the API's field names, keeping only fields"""
+    items = []
+    for row in rows:
+        item = {}
+        for name in fields:
+            if name == 'url':
+                item[name] = reverse(url_name, args=[row['slug']])
+            else:
+                item[name] = row[columns[name]]
+        items.append(item)
+    return items
+
+
+def lookups(fields, columns, *always):
+    return list(dict.fromkeys([*always, *(columns[name] for name in fields)]))
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def _listing_validator(request):
+    return listing_validator(request, request.GET.get('category') or None)
+
+
+@require_GET
+@api_view
+@conditional_page(listing_validator, personal=False)
+def categories(request):
+    fields = parse_fields(request, CATEGORY_FIELDS, CATEGORY_FIELDS)
+
+    def build():
+        rows = Category.objects.values(*lookups(fields, CATEGORY_FIELDS))
+        return serialize(rows, fields, CATEGORY_FIELDS, 'shop:product_list_by_category')
+
+    return json_response({'results': get_or_build('api_categories', build, fields)})
+
+
+@require_GET
+@api_view
+@conditional_page(_listing_validator, personal=False)
+def products(request):
+    fields = parse_fields(request, PRODUCT_FIELDS, PRODUCT_LIST_FIELDS)
+    limit = parse_limit(request)
+    category_slug = request.GET.get('category') or None
+    cursor = parse_cursor(request)
+
+    def build():
+        queryset = Product.objects.filter(available=True)
+        if category_slug:
+            category_id = Category.objects.filter(slug=category_slug).values_list('id', flat=True).first()
+            if category_id is None:
+                return None
+            queryset = queryset.filter(category_id=category_id)
+        # The cursor is built from created_at and id, whatever the fields
+        rows = queryset.values(*lookups(fields, PRODUCT_FIELDS, 'id', 'created_at'))
+        page = KeysetPaginator(rows, per_page=limit).get_page(cursor)
+        return {
+            'results': serialize(page, fields, PRODUCT_FIELDS, 'shop:product_detail'),
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
+
+    page = get_or_build('api_products', build, category_slug, cursor, limit, fields)
+    if page is None:
+        raise ApiError('No category matches the given query.', status=404)
+    return json_response({
+        'results': page['results'],
+        'next': page_link(request, page['next_cursor']),
+        'previous': page_link(request, page['previous_cursor']),
+    })
+
+
+@require_GET
+@api_view
+@conditional_page(product_validator, personal=False)
+def product(request, slug):
+    fields = parse_fields(request, PRODUCT_FIELDS, PRODUCT_FIELDS)
+
+    def build():
+        row = Product.objects.filter(slug=slug, available=True).values(*lookups(fields, PRODUCT_FIELDS)).first()
+        return None if row is None else serialize([row], fields, PRODUCT_FIELDS, 'shop:product_detail')[0]
+
+    data = get_or_build('api_product', build, slug, fields, stock_of=slug)
+    if data is None:
+        raise ApiError('No product matches the given query.', status=404)
+    return json_response(data)
+
+
+def serialize_cart(cart):
+    """The cart's lines and totals, from a single .values() query"""
+    if cart is None:
+        return {'items': [], 'total_items': 0, 'total_price': Decimal('0.00')}
+    rows = cart.items.with_line_totals().order_by('id').values(
+        'product_id', 'product__slug', 'product__name', 'product__price', 'quantity', 'line_total',
+    )
+    items = [
+        {
+            'product': row['product_id'],
+            'slug': row['product__slug'],
+            'name': row['product__name'],
+            'price': row['product__price'],
+            'quantity': row['quantity'],
+            # SQLite computes the product in floating point
+            'line_total': row['line_total'].quantize(CENTS),
+        }
+        for row in rows
+    ]
+    return {
+        'items': items,
+        'total_items': sum(item['quantity'] for item in items),
+        'total_price': sum((item['line_total'] for item in items), Decimal('0.00')),
+    }
+
+
+def request_data(request):
+    if request.content_type != 'application/json':
+        return request.POST
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError('The request body is not valid JSON')
+    if not isinstance(data, dict):
+        raise ApiError('The request body must be a JSON object')
+    return data
+
+
+@never_cache
+@ensure_csrf_cookie
+@require_GET
+def cart(request):
+    return json_response(serialize_cart(get_cart(request).instance))
+
+
+@never_cache
+@require_POST
+@api_view
+def cart_add(request):
+    """Add {"product": id, "quantity": n} to the cart; "override": true sets the quantity instead"""
+    data = request_data(request)
+    form = CartAddProductForm(data)
+    if not form.is_valid():
+        return json_response({'error': 'Invalid cart line', 'fields': form.errors.get_json_data()}, status=400)
+    try:
+        product = Product.objects.filter(pk=int(data.get('product'))).first()
+    except (TypeError, ValueError):
+        raise ApiError('product must be a product id')
+    if product is None:
+        raise ApiError('No product matches the given query.', status=404)
+    cart = get_cart(request).persist()
+    add_item(cart, product, form.cleaned_data['quantity'], form.cleaned_data['override'])
+    return json_response(serialize_cart(cart))
+
+
+@never_cache
+@require_http_methods(['DELETE'])
+def cart_remove(request, product_id):
+    cart = get_cart(request).instance
+    if cart is not None:
+        remove_item(cart, product_id)
+    return json_response(serialize_cart(cart))
@@ -3,4 +3,13 @@ from django.apps import AppConfig
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'shop'
\ No newline at end of file
+    name = 'shop'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import signals  # noqa: F401
+
+        if settings.BENCH_DB_LATENCY_MS:
+            from .benchmark import simulate_db_latency
+            simulate_db_latency(settings.BENCH_DB_LATENCY_MS / 1000)
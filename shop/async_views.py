@@ -0,0 +1,103 @@
+"""
+Async versions of the read-heavy storefront views, used when SERVER_MODE is
+'asgi' (see shop.urls).
+
+Every query goes through the async ORM, so a slow database round trip parks
+the coroutine instead of a worker. Templates still render synchronously,
+which is why prepare() resolves the user and the cart up front: the context
+processors then read them without touching the database.
+"""
+from django.http import Http404
+from django.shortcuts import render
+
+from .cart import get_cart
+from .catalog_cache import aget_or_build
+from .conditional import alisting_validator, aproduct_validator, conditional_page
+from .forms import CartAddProductForm
+from .models import Category, Product
+from .pagination import KeysetPaginator, normalize_cursor
+from .views import PRODUCTS_PER_PAGE
+
+
+async def prepare(request):
+    """Load what the base template's context processors read"""
+    request.user = await request.auser()
+    await get_cart(request).aload()
+
+
+@conditional_page(alisting_validator)
+async def home(request):
+    async def featured_products():
+        return [p async for p in Product.objects.filter(featured=True, available=True)[:6]]
+
+    async def categories():
+        return [c async for c in Category.objects.all()[:6]]
+
+    await prepare(request)
+    context = {
+        'featured_products': await aget_or_build('featured_products', featured_products),
+        'categories': await aget_or_build('home_categories', categories),
+    }
+    return render(request, 'shop/home.html', context)
+
+
+@conditional_page(alisting_validator)
+async def product_list(request, category_slug=None):
+    async def all_categories():
+        return [c async for c in Category.objects.all()]
+
+    async def find_category():
+        return await Category.objects.filter(slug=category_slug).afirst()
+
+    await prepare(request)
+    category = None
+    categories = await aget_or_build('categories', all_categories)
+    products = Product.objects.filter(available=True)
+
+    if category_slug:
+        category = await aget_or_build('category', find_category, category_slug)
+        if category is None:
+            raise Http404('No Category matches the given query.')
+        products = products.filter(category=category)
+
+    cursor = normalize_cursor(request.GET.get('cursor'))
+
+    async def build_page():
+        return await KeysetPaginator(products, per_page=PRODUCTS_PER_PAGE).aget_page(cursor)
+
+    page = await aget_or_build('product_page', build_page, category_slug, cursor)
+
+    context = {
+        'category': category,
+        'categories': categories,
+        # Stored counts: the sidebar costs no query per category
+        'available_total': sum(c.available_count for c in categories),
+        'products': page,
+        'page': page,
+        'cursor': cursor,
+    }
+    return render(request, 'shop/product/list.html', context)
+
+
+@conditional_page(aproduct_validator, shared=False)
+async def product_detail(request, slug):
+    async def find_product():
+        return await Product.objects.select_related('category').filter(slug=slug, available=True).afirst()
+
+    await prepare(request)
+    product = await aget_or_build('product', find_product, slug, stock_of=slug)
+    if product is None:
+        raise Http404('No Product matches the given query.')
+    context = {
+        'product': product,
+        'cart_product_form': CartAddProductForm(),
+    }
+    return render(request, 'shop/product/detail.html', context)
+
+
+async def cart_detail(request):
+    await prepare(request)
+    context = {
+        'cart': get_cart(request),
+    }
+    return render(request, 'shop/cart/detail.html', context)
@@ -0,0 +1,95 @@
+"""
+PostgreSQL backend with a process-wide psycopg 3 connection pool.
+
+Django 5.0 has no pool of its own (OPTIONS['pool'] arrived in 5.1), so this
+wraps the stock backend: connect() borrows from a psycopg_pool.ConnectionPool
+and close() gives the connection back, which makes CONN_MAX_AGE = 0 the right
+setting. Configured by OPTIONS:
+
+    'pool': keyword arguments for ConnectionPool (min_size, max_size,
+            timeout, max_lifetime, max_idle, ...).
+    'prepare_catalog_queries': prepare catalog SELECTs on the server so hot
+            storefront queries skip parsing and planning on every request.
+            Needs server-side parameter binding, which this turns on.
+"""
+import sys
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel, is_psycopg3
+
+if not is_psycopg3:
+    raise ImproperlyConfigured('The pooled PostgreSQL backend requires psycopg 3 and psycopg_pool.')
+
+from psycopg_pool import ConnectionPool  # noqa: E402
+
+CATALOG_TABLES = ('"shop_product"', '"shop_category"')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_stats():
+    """Counters of every pool in this process, by database alias"""
+    return {alias: pool.get_stats() for alias, pool in _pools.items()}
+
+
+class CatalogPreparingCursor(base.ServerBindingCursor):
+    """Server-side binding cursor that prepares reads of the catalog tables and nothing else"""
+
+    def execute(self, query, params=None, *, prepare=None, binary=None):
+        if prepare is None and isinstance(query, str) and query.startswith('SELECT'):
+            if any(f'FROM {table}' in query for table in CATALOG_TABLES):
+                prepare = True
+        return super().execute(query, params, prepare=prepare, binary=binary)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pool(self):
+        if self.alias not in _pools:
+            with _pools_lock:
+                if self.alias not in _pools:
+                    _pools[self.alias] = ConnectionPool(
+                        kwargs=self.get_connection_params(),
+                        name=self.alias,
+                        open=False,
+                        check=ConnectionPool.check_connection,
+                        **self.settings_dict['OPTIONS'].get('pool', {}),
+                    )
+        return _pools[self.alias]
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        if params.pop('prepare_catalog_queries', False):
+            params['cursor_factory'] = CatalogPreparingCursor
+            # Django turns preparation off with prepare_threshold=None; a
+            # threshold that is never reached keeps it to the catalog reads
+            if params['prepare_threshold'] is None:
+                params['prepare_threshold'] = sys.maxsize
+        return params
+
+    def get_new_connection(self, conn_params):
+        # Opening is idempotent; done lazily so that importing settings or
+        # running manage.py without touching the database never connects.
+        self.pool.open()
+        connection = self.pool.getconn()
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        if isolation_level is None:
+            self.isolation_level = IsolationLevel.READ_COMMITTED
+        else:
+            try:
+                self.isolation_level = IsolationLevel(isolation_level)
+            except ValueError:
+                raise ImproperlyConfigured(f'Invalid transaction isolation level {isolation_level}.')
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # putconn() rolls back anything left open before reuse
+                self.pool.putconn(self.connection)
+                self.connection = None
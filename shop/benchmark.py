@@ -0,0 +1,121 @@
+"""
+Helpers for the benchmark commands: timing loops, latency percentiles and
+comparison of a run against a saved JSON baseline.
+"""
+import json
+import math
+import time
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(latencies, elapsed, queries=None, extra=None):
+    result = {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    if queries is not None:
+        result['queries_per_request'] = round(sum(queries) / len(queries), 2) if queries else 0.0
+    if extra:
+        result.update(extra)
+    return result
+
+
+def measure(action, iterations, setup=None, warmup=0):
+    """
+    Call action() iterations times, returning its summary.
+
+    setup(), when given, runs untimed before every call. Queries are counted
+    on the default connection for each timed call.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        action()
+
+    latencies = []
+    queries = []
+    elapsed = 0.0
+    for _ in range(iterations):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            action()
+            duration = time.perf_counter() - start
+        latencies.append(duration)
+        queries.append(len(captured))
+        elapsed += duration
+    return summarize(latencies, elapsed, queries)
+
+
+def format_table(results):
+    width = max([18] + [len(name) + 2 for name in results])
+    header = f"{'scenario':<{width}}{'reqs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>9}"
+    lines = [header, '-' * len(header)]
+    for name, result in results.items():
+        lines.append(
+            f"{name:<{width}}{result['requests']:>6}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+            f"{result['p99_ms']:>10.2f}{result['throughput_rps']:>10.1f}"
+            f"{result.get('queries_per_request', 0):>9.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def compare(results, baseline, threshold):
+    """Return (lines, regressions) comparing p95 latency and queries with a baseline run"""
+    lines = []
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            lines.append(f'{name}: no baseline')
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+        query_change = result.get('queries_per_request', 0) - before.get('queries_per_request', 0)
+        lines.append(
+            f"{name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms ({change:+.1f}%), "
+            f"queries {before.get('queries_per_request', 0):.1f} -> {result.get('queries_per_request', 0):.1f}"
+        )
+        if change > threshold or query_change > 0:
+            regressions.append(name)
+    return lines, regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(path, results, **metadata):
+    with open(path, 'w') as f:
+        json.dump({'meta': metadata, 'results': results}, f, indent=2, sort_keys=True)
+
+
+def simulate_db_latency(seconds):
+    """Add seconds of blocking delay to every query on every connection, like a distant database"""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        # First in line, so execute_wrapper() blocks stacked later still pop their own wrapper
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, delay)
+
+    connection_created.connect(install, weak=False)
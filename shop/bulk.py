@@ -0,0 +1,57 @@
+"""
+Set-based bulk edits of products.
+
+update_products() runs a single UPDATE over a Product queryset (filtered,
+searched or a selection) and bumps the catalog-cache version once. The
+helpers below build the price and stock expressions it takes. Nothing here
+changes the name or description, so the search index needs no refresh;
+category counts follow changes to availability (see shop.counts).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Greatest, Least, Round
+from django.utils import timezone
+
+from .catalog_cache import bump_catalog_version
+from .counts import update_changes
+
+MAX_PRICE = Decimal('99999999.99')
+
+
+def update_products(queryset, **changes):
+    """UPDATE every product in queryset with changes, returning the number of rows"""
+    if not changes:
+        return 0
+    # update() skips auto_now, and updated_at feeds conditional GETs
+    changes['updated_at'] = timezone.now()
+    with transaction.atomic():
+        deltas = update_changes(queryset, changes)
+        count = queryset.order_by().update(**changes)
+        deltas.apply()
+    if count:
+        bump_catalog_version()
+    return count
+
+
+def _clamp_price(expression):
+    return Least(
+        Greatest(Round(expression, 2), Value(Decimal('0.00'))),
+        Value(MAX_PRICE),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def price_by_percent(percent):
+    """Price scaled by percent (negative to discount), rounded to cents and kept in range"""
+    return _clamp_price(F('price') * Value(1 + Decimal(percent) / 100))
+
+
+def price_by_amount(amount):
+    return _clamp_price(F('price') + Value(Decimal(amount)))
+
+
+def stock_by_delta(delta):
+    """Stock plus delta units, stopping at zero"""
+    return Greatest(F('stock') + Value(int(delta)), Value(0))
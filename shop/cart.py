@@ -0,0 +1,185 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import CENTS, Cart, CartItem, CartSummary, Product
+
+
+class LazyCart:
+    """
+    The visitor's cart for the current request, loaded only when read.
+
+    Reads never create anything: a visitor without a session or a saved
+    cart gets an empty summary. The session and the Cart row are created
+    by persist(), which is only called when an item is added.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def instance(self):
+        if self.request.user.is_authenticated:
+            return Cart.objects.filter(user=self.request.user).first()
+        session_key = self.request.session.session_key
+        if not session_key:
+            return None
+        return Cart.objects.filter(session_key=session_key).first()
+
+    @property
+    def summary(self):
+        if self.instance is None:
+            return CartSummary([])
+        return self.instance.summary
+
+    @property
+    def total_items(self):
+        return self.summary.total_items
+
+    @property
+    def total_price(self):
+        return self.summary.total_price
+
+    async def aload(self):
+        """Load the cart and its summary with the async ORM, so templates read them without queries"""
+        if 'instance' in self.__dict__:
+            return self
+        user = await self.request.auser()
+        session_key = self.request.session.session_key
+        cart = None
+        if user.is_authenticated:
+            cart = await Cart.objects.filter(user=user).afirst()
+        elif session_key:
+            cart = await Cart.objects.filter(session_key=session_key).afirst()
+        if cart is not None:
+            cart.summary = CartSummary([item async for item in cart.items.with_line_totals()])
+        self.instance = cart
+        return self
+
+    def persist(self):
+        """Return the saved Cart, creating the session and the cart on first use"""
+        if self.instance is not None:
+            return self.instance
+        if self.request.user.is_authenticated:
+            cart, created = Cart.objects.get_or_create(user=self.request.user)
+        else:
+            if not self.request.session.session_key:
+                self.request.session.create()
+            cart, created = Cart.objects.get_or_create(session_key=self.request.session.session_key)
+        self.instance = cart
+        return cart
+
+
+def get_cart(request):
+    """Return the request's LazyCart, shared by the view, its template and cart_context"""
+    if not hasattr(request, '_cart'):
+        request._cart = LazyCart(request)
+    return request._cart
+
+
+def add_item(cart, product, quantity, override=False):
+    """
+    Add quantity of product to a saved cart, or set its quantity with
+    override, returning the line's new quantity.
+
+    One INSERT ... ON CONFLICT on (cart, product), so concurrent adds of the
+    same product both count and nothing is read first.
+    """
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': quantity})
+        if not created:
+            item.quantity = quantity if override else item.quantity + quantity
+            item.save(update_fields=['quantity', 'updated_at'])
+        cart.touch()
+        return item.quantity
+
+    quantity_sql = 'EXCLUDED.quantity' if override else 'shop_cartitem.quantity + EXCLUDED.quantity'
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    # One commit for the line and the cart's timestamp
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO shop_cartitem (cart_id, product_id, quantity, created_at, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s) "
+            "ON CONFLICT (cart_id, product_id) DO UPDATE "
+            f"SET quantity = {quantity_sql}, updated_at = EXCLUDED.updated_at "
+            "RETURNING quantity",
+            [cart.pk, product.pk, quantity, now, now],
+        )
+        new_quantity = cursor.fetchone()[0]
+        cart.touch()
+    return new_quantity
+
+
+def remove_item(cart, product):
+    """Remove product from a saved cart, returning whether it was there"""
+    with transaction.atomic():
+        deleted, _ = CartItem.objects.filter(cart=cart, product=product).delete()
+        if deleted:
+            cart.touch()
+    return bool(deleted)
+
+
+def merge_session_cart(session_key, user):
+    """
+    Move the lines of session_key's anonymous cart into user's cart, summing
+    the quantities of products in both, and delete the anonymous cart.
+    Returns the number of lines written.
+
+    The lines move in one INSERT ... SELECT ... ON CONFLICT, whatever their
+    number. On PostgreSQL the SELECT reads from a DELETE ... RETURNING of the
+    anonymous lines, so when two logins merge the same cart at once the
+    second one blocks on the first and finds nothing left to move. SQLite
+    runs one write transaction at a time, which gives the same guarantee.
+    """
+    anonymous = Cart.objects.filter(session_key=session_key, user=None).values_list('pk', flat=True).first()
+    if anonymous is None:
+        return 0
+    # The unique user constraint lets concurrent logins share one cart
+    cart, _ = Cart.objects.get_or_create(user=user)
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    upsert = (
+        "INSERT INTO shop_cartitem (cart_id, product_id, quantity, created_at, updated_at) "
+        "SELECT %s, product_id, quantity, created_at, %s FROM {source} "
+        "ON CONFLICT (cart_id, product_id) DO UPDATE "
+        "SET quantity = shop_cartitem.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at"
+    )
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "WITH moved AS ("
+                    "DELETE FROM shop_cartitem WHERE cart_id = %s RETURNING product_id, quantity, created_at"
+                    ") " + upsert.format(source='moved'),
+                    [anonymous, cart.pk, now],
+                )
+                moved = cursor.rowcount
+        elif connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                # The WHERE clause also settles SQLite's parsing of SELECT ... ON CONFLICT
+                cursor.execute(upsert.format(source='shop_cartitem WHERE cart_id = %s'), [cart.pk, now, anonymous])
+                moved = cursor.rowcount
+        else:
+            lines = list(CartItem.objects.filter(cart_id=anonymous).values_list('product_id', 'quantity'))
+            for product_id, quantity in lines:
+                add_item(cart, Product(pk=product_id), quantity)
+            moved = len(lines)
+        # Its lines go with it where they were not moved out above
+        Cart.objects.filter(pk=anonymous, user=None).delete()
+        cart.touch()
+    return moved
+
+
+def cart_totals(cart):
+    """(item count, subtotal) of a saved cart in one aggregate query"""
+    totals = cart.items.aggregate(
+        count=Sum('quantity'),
+        subtotal=Sum(
+            F('quantity') * F('product__price'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+    return totals['count'] or 0, (totals['subtotal'] or Decimal('0')).quantize(CENTS)
@@ -0,0 +1,194 @@
+"""
+Versioned cache for catalog data and rendered catalog fragments.
+
+Every key embeds the current catalog version. Saving or deleting a Product
+or Category bumps the version (see shop.signals), which makes all older
+entries unreachable at once instead of deleting them one by one.
+
+Entries carry a soft expiry. When it passes, a single worker takes a
+short-lived lock and rebuilds the entry while the others keep serving the
+stale copy, so an expired page does not send every worker to the database.
+aget_or_build() is the same protocol for async views, over the async cache
+API and an async builder.
+
+With a read replica, the first reads after a bump could come from a
+replica that has not replayed the write yet, and would fill the new
+version's entries with the old data for CATALOG_CACHE_TIMEOUT. For
+REPLICA_STICKY_SECONDS after a bump, the replica lag the writer's own pin
+allows for, entries are therefore built from the primary.
+
+Checkout changes stock all day long, and only a product's own pages show
+its stock: listings only show whether it is in stock. A sale therefore
+moves the stock stamp of the products sold instead of the catalog version
+(see shop.checkout), and entries built with stock_of=<slug> carry that
+stamp in their key. The stamp counts as a bump for the replica as well.
+"""
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import REPLICA, replica_reads
+
+VERSION_KEY = 'catalog:version'
+BUMPED_KEY = 'catalog:bumped_at'
+STOCK_KEY = 'catalog:stock:{}'
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2
+STALE_GRACE = 60
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a version lost to eviction is never reused
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # Stamped first, so whoever sees the new version also sees the stamp
+    cache.set(BUMPED_KEY, time.time(), None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        catalog_version()
+        return cache.incr(VERSION_KEY)
+
+
+def stock_stamp(slug):
+    key = STOCK_KEY.format(slug)
+    stamp = cache.get(key)
+    if stamp is None:
+        # A fresh stamp rather than a default, so one lost to eviction is never reused
+        cache.add(key, time.time(), None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump_stock(slugs):
+    """Move the stock stamps of the products with these slugs"""
+    now = time.time()
+    cache.set_many({STOCK_KEY.format(slug): now for slug in slugs}, None)
+
+
+def make_key(name, *parts):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'catalog:{catalog_version()}:{name}:{digest}'
+
+
+def _replica_lagging(bumped_at):
+    return bumped_at is not None and time.time() - bumped_at < settings.REPLICA_STICKY_SECONDS
+
+
+def _build(builder, stamp=None):
+    """builder(), reading the primary while a replica may not have the last catalog write"""
+    if REPLICA in settings.DATABASES and (_replica_lagging(cache.get(BUMPED_KEY)) or _replica_lagging(stamp)):
+        with replica_reads(False):
+            return builder()
+    return builder()
+
+
+def get_or_build(name, builder, *parts, timeout=None, stock_of=None):
+    """
+    Return the cached value for (name, *parts), calling builder() to rebuild
+    it when needed. stock_of is the slug of a product whose stock the value
+    shows.
+    """
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+    stamp = None
+    if stock_of is not None:
+        stamp = stock_stamp(stock_of)
+        parts = (*parts, stamp)
+    key = make_key(name, *parts)
+    entry = cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = _build(builder, stamp)
+            cache.set(key, (value, time.time() + timeout), timeout + STALE_GRACE)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    if entry is not None:
+        return entry[0]
+
+    # Another worker is building a cold entry; wait for it briefly
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return _build(builder, stamp)
+
+
+async def acatalog_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+async def astock_stamp(slug):
+    key = STOCK_KEY.format(slug)
+    stamp = await cache.aget(key)
+    if stamp is None:
+        await cache.aadd(key, time.time(), None)
+        stamp = await cache.aget(key)
+    return stamp
+
+
+async def amake_key(name, *parts):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'catalog:{await acatalog_version()}:{name}:{digest}'
+
+
+async def _abuild(builder, stamp=None):
+    if REPLICA in settings.DATABASES and (_replica_lagging(await cache.aget(BUMPED_KEY)) or _replica_lagging(stamp)):
+        with replica_reads(False):
+            return await builder()
+    return await builder()
+
+
+async def aget_or_build(name, builder, *parts, timeout=None, stock_of=None):
+    """Async get_or_build(); builder is a coroutine function"""
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+    stamp = None
+    if stock_of is not None:
+        stamp = await astock_stamp(stock_of)
+        parts = (*parts, stamp)
+    key = await amake_key(name, *parts)
+    entry = await cache.aget(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = await _abuild(builder, stamp)
+            await cache.aset(key, (value, time.time() + timeout), timeout + STALE_GRACE)
+        finally:
+            await cache.adelete(lock_key)
+        return value
+
+    if entry is not None:
+        return entry[0]
+
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry[0]
+    return await _abuild(builder, stamp)
@@ -0,0 +1,92 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .catalog_cache import bump_catalog_version, bump_stock
+from .models import CartItem, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f'Not enough stock for: {names}')
+
+
+def place_order(order, cart):
+    """
+    Save order with one OrderItem per cart line, decrement stock and empty the cart.
+
+    Everything happens in one transaction with a fixed number of queries: the
+    products are locked in id order (so concurrent checkouts cannot deadlock
+    or oversell), stock is decremented by a single UPDATE using F()
+    expressions and the order lines are written with bulk_create. The
+    UPDATE skips the Product signals, so it sets updated_at itself and the
+    cache is invalidated once the transaction commits: only the stock stamps
+    of the products sold, unless one of them sells out and the listings have
+    to show it out of stock, which takes a catalog-version bump. cart may be
+    None for a visitor who never added anything; that fails like an empty
+    cart.
+    """
+    if cart is None:
+        raise CheckoutError('Your cart is empty.')
+
+    with transaction.atomic():
+        lines = list(
+            CartItem.objects.filter(cart=cart)
+            .order_by('product_id')
+            .values_list('product_id', 'quantity')
+        )
+        if not lines:
+            raise CheckoutError('Your cart is empty.')
+
+        quantities = dict(lines)
+        products = list(
+            Product.objects.select_for_update()
+            .filter(id__in=quantities)
+            .order_by('id')
+            .only('id', 'slug', 'name', 'price', 'stock', 'available')
+        )
+
+        short = [
+            product for product in products
+            if not product.available or product.stock < quantities[product.id]
+        ]
+        if short:
+            raise InsufficientStock(short)
+
+        Product.objects.filter(id__in=quantities).update(
+            stock=F('stock') - Case(
+                *[When(id=product_id, then=Value(quantity)) for product_id, quantity in lines],
+                output_field=IntegerField(),
+            ),
+            # update() skips auto_now, and updated_at feeds conditional GETs
+            updated_at=timezone.now(),
+        )
+        if any(product.stock == quantities[product.id] for product in products):
+            transaction.on_commit(bump_catalog_version)
+        else:
+            transaction.on_commit(partial(bump_stock, [product.slug for product in products]))
+
+        order.total_amount = sum(product.price * quantities[product.id] for product in products)
+        order.save()
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=product,
+                price=product.price,
+                quantity=quantities[product.id],
+            )
+            for product in products
+        ])
+
+        CartItem.objects.filter(cart=cart).delete()
+
+    return order
@@ -0,0 +1,177 @@
+"""
+Conditional GET for the catalog pages.
+
+A page's validator comes from the rows it shows: the latest updated_at and
+the row count of its products (one category or all of them) and of the
+categories in the sidebar, or the product and its category on a detail
+page. Counts catch deletions, which leave no newer updated_at behind.
+Validators are cached under the catalog version, so checking a warm page
+costs no query, and conditional_page() answers If-None-Match and
+If-Modified-Since with a 304 before the view renders anything.
+
+Pages also show the visitor's name, cart and flash messages, so the ETag
+covers the user and the cart, and a request with pending messages is always
+rendered. A page with nothing of the visitor in it is public, for a CDN to
+keep CATALOG_CDN_MAX_AGE seconds; any other page is private and revalidated
+by the browser on every view.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cart import get_cart
+from .catalog_cache import aget_or_build, get_or_build
+from .models import Category, Product
+
+LATEST = {'latest': Max('updated_at'), 'count': Count('id')}
+
+
+def _validator(*stamps):
+    """(last modified, token) over (latest updated_at, row count or id) pairs"""
+    latest = max((stamp for stamp, tag in stamps if stamp), default=None)
+    token = ' '.join(f'{tag}@{stamp.timestamp() if stamp else 0}' for stamp, tag in stamps)
+    return latest, token
+
+
+def _listing_products(category_slug):
+    products = Product.objects.all()
+    if category_slug:
+        products = products.filter(category__slug=category_slug)
+    return products
+
+
+def _product_row(slug):
+    return Product.objects.filter(slug=slug, available=True).values_list('pk', 'updated_at', 'category__updated_at')
+
+
+def listing_validator(request, category_slug=None):
+    """Validator of the home page and the product lists: their products and every category"""
+    def build():
+        products = _listing_products(category_slug).aggregate(**LATEST)
+        categories = Category.objects.aggregate(**LATEST)
+        return _validator(*(
+            (stamps['latest'], stamps['count']) for stamps in (products, categories)
+        ))
+
+    return get_or_build('listing_validator', build, category_slug)
+
+
+async def alisting_validator(request, category_slug=None):
+    async def build():
+        products = await _listing_products(category_slug).aaggregate(**LATEST)
+        categories = await Category.objects.aaggregate(**LATEST)
+        return _validator(*(
+            (stamps['latest'], stamps['count']) for stamps in (products, categories)
+        ))
+
+    return await aget_or_build('listing_validator', build, category_slug)
+
+
+def product_validator(request, slug):
+    def build():
+        row = _product_row(slug).first()
+        return None if row is None else _validator((row[1], row[0]), (row[2], 1))
+
+    return get_or_build('product_validator', build, slug, stock_of=slug)
+
+
+async def aproduct_validator(request, slug):
+    async def build():
+        row = await _product_row(slug).afirst()
+        return None if row is None else _validator((row[1], row[0]), (row[2], 1))
+
+    return await aget_or_build('product_validator', build, slug, stock_of=slug)
+
+
+def visitor_key(request):
+    """Who the page is rendered for; empty for an anonymous visitor with an empty cart"""
+    parts = []
+    if request.user.is_authenticated:
+        parts.append(f'user:{request.user.pk}')
+    cart = get_cart(request)
+    if cart.instance is not None and cart.total_items:
+        parts.append(f'cart:{cart.instance.pk}:{cart.instance.updated_at.timestamp()}:{cart.total_items}')
+    return ' '.join(parts)
+
+
+def _conditional(request, personal):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # Pending flash messages are shown once, so that page must be rendered
+    return not (personal and request.COOKIES.get(CookieStorage.cookie_name))
+
+
+def _check(request, validator, personal):
+    """Return (etag, last_modified, visitor, 304 response or None)"""
+    if validator is None:
+        return None, None, None, None
+    last_modified, token = validator
+    visitor = visitor_key(request) if personal else ''
+    digest = hashlib.md5(f'{settings.RELEASE}|{token}|{visitor}'.encode(), usedforsecurity=False).hexdigest()
+    # Weak: every rendering masks the CSRF token differently
+    etag = f'W/"{digest}"'
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    return etag, last_modified, visitor, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _finish(request, response, etag, last_modified, visitor, shared):
+    if response.status_code not in (200, 304):
+        return response
+    if etag is not None:
+        response.headers.setdefault('ETag', etag)
+        if last_modified:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+    # A rendered CSRF token belongs to this visitor, like the user and cart
+    if shared and visitor == '' and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=0,
+            s_maxage=settings.CATALOG_CDN_MAX_AGE,
+            stale_while_revalidate=settings.CATALOG_CDN_STALE_WHILE_REVALIDATE,
+        )
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(validator, shared=True, personal=True):
+    """
+    condition() for catalog pages: validator(request, *args, **kwargs)
+    returns (last modified, token) or None, and is a coroutine function for
+    async views. shared=False keeps the page out of shared caches even for
+    anonymous visitors, for pages that render a form; personal=False is for
+    responses that show nothing of the visitor, like the JSON catalog.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                if not _conditional(request, personal):
+                    return await view(request, *args, **kwargs)
+                # Loaded with the async ORM here, the view's prepare() reuses them
+                request.user = await request.auser()
+                await get_cart(request).aload()
+                etag, last_modified, visitor, response = _check(
+                    request, await validator(request, *args, **kwargs), personal
+                )
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified, visitor, shared)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                if not _conditional(request, personal):
+                    return view(request, *args, **kwargs)
+                etag, last_modified, visitor, response = _check(request, validator(request, *args, **kwargs), personal)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified, visitor, shared)
+        return inner
+    return decorator
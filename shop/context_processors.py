@@ -1,21 +1,13 @@
-from .models import Cart
+from .cart import get_cart
 
 def cart_context(request):
     """Add cart information to all template contexts"""
     cart_count = 0
 
     try:
-        if request.user.is_authenticated:
-            cart = Cart.objects.filter(user=request.user).first()
-        else:
-            session_key = request.session.session_key
-            if session_key:
-                cart = Cart.objects.filter(session_key=session_key).first()
-            else:
-                cart = None
-
-        if cart:
-            cart_count = cart.total_items
+        # Shares the view's LazyCart: no queries without a saved cart and
+        # a single summary computation when the view already read it
+        cart_count = get_cart(request).total_items
     except:
         cart_count = 0
 
@@ -0,0 +1,122 @@
+"""
+Product counts per category, stored on Category.
+
+product_count and available_count change by deltas, applied right after
+the products change: for single saves and deletes by the Product signals
+(see signals.py), inside the caller's transaction if there is one, and for
+the bulk paths, which know the rows they touch, inside their own:
+bulk.update_products(), import_catalog and seed_bench. Deltas are relative
+UPDATEs, so concurrent writers add up rather than overwrite each other, and
+they touch updated_at, which the listing pages' validators follow.
+
+Writes that go around these paths (raw SQL, other QuerySet.update() calls
+on category or available, loaddata) leave the counts behind; reconcile()
+and the reconcile_category_counts command recount and fix them.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Category, Product
+
+
+class CountDeltas:
+    """Pending changes to the counts of some categories"""
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0])
+
+    def change(self, old, new, rows=1):
+        """rows products went from old to new, each a (category_id, available) pair or None"""
+        if old == new:
+            return
+        if old is not None:
+            delta = self.deltas[old[0]]
+            delta[0] -= rows
+            delta[1] -= rows if old[1] else 0
+        if new is not None:
+            delta = self.deltas[new[0]]
+            delta[0] += rows
+            delta[1] += rows if new[1] else 0
+
+    def apply(self):
+        """One UPDATE per changed category, in id order so concurrent writers cannot deadlock"""
+        now = timezone.now()
+        for category_id, (products, available) in sorted(self.deltas.items()):
+            if products or available:
+                Category.objects.filter(pk=category_id).update(
+                    # Drift must not push a count below zero and fail the write
+                    product_count=Greatest(F('product_count') + Value(products), Value(0)),
+                    available_count=Greatest(F('available_count') + Value(available), Value(0)),
+                    updated_at=now,
+                )
+        self.deltas.clear()
+
+
+def product_state(product):
+    return product.category_id, product.available
+
+
+def update_changes(queryset, changes):
+    """CountDeltas of an UPDATE setting changes on queryset, from its rows before the update"""
+    deltas = CountDeltas()
+    category = changes.get('category_id', changes.get('category'))
+    if category is None and 'available' not in changes:
+        return deltas
+    rows = queryset.order_by().values('category_id', 'available').annotate(rows=Count('pk'))
+    for row in rows:
+        old = (row['category_id'], row['available'])
+        new = (
+            old[0] if category is None else getattr(category, 'pk', category),
+            changes.get('available', old[1]),
+        )
+        deltas.change(old, new, row['rows'])
+    return deltas
+
+
+def _actual_counts(category_ids):
+    rows = (
+        Product.objects.filter(category_id__in=category_ids).order_by()
+        .values('category_id')
+        .annotate(products=Count('pk'), available=Count('pk', filter=Q(available=True)))
+    )
+    return {row['category_id']: (row['products'], row['available']) for row in rows}
+
+
+def reconcile(batch_size=1000, dry_run=False):
+    """
+    Recount the products of every category and fix the stored counts that
+    are off, returning (category, stored, actual) for each of them.
+
+    Each batch of categories is locked while it is recounted: a writer's
+    delta then lands either before the recount, which includes its rows, or
+    after the fix, on top of it.
+    """
+    drifted = []
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            categories = Category.objects.filter(pk__gt=last_id).order_by('pk')
+            if not dry_run:
+                categories = categories.select_for_update()
+            categories = list(categories.only('id', 'name', 'product_count', 'available_count')[:batch_size])
+            if not categories:
+                return drifted
+            last_id = categories[-1].pk
+            actual = _actual_counts([category.pk for category in categories])
+            off = []
+            for category in categories:
+                stored = (category.product_count, category.available_count)
+                counted = actual.get(category.pk, (0, 0))
+                if stored != counted:
+                    drifted.append((category, stored, counted))
+                    category.product_count, category.available_count = counted
+                    off.append(category)
+            if off and not dry_run:
+                now = timezone.now()
+                for category in off:
+                    category.updated_at = now
+                Category.objects.bulk_update(off, ['product_count', 'available_count', 'updated_at'])
@@ -0,0 +1,157 @@
+"""
+Streaming CSV and JSONL exports of orders and products.
+
+Rows come from ``.values().iterator(chunk_size=...)`` and are encoded one at
+a time into a ``StreamingHttpResponse``, so memory stays flat however many
+rows are exported. Product exports use the column names ``import_catalog``
+reads, so an export can be loaded back unchanged.
+"""
+import csv
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, Product
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Export column -> ORM lookup
+ORDER_COLUMNS = {
+    'order_id': 'id',
+    'created_at': 'created_at',
+    'status': 'status',
+    'username': 'user__username',
+    'email': 'email',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'address': 'address',
+    'postal_code': 'postal_code',
+    'city': 'city',
+    'country': 'country',
+    'total_amount': 'total_amount',
+    'item_id': 'items__id',
+    'product_slug': 'items__product__slug',
+    'product_name': 'items__product__name',
+    'quantity': 'items__quantity',
+    'price': 'items__price',
+}
+PRODUCT_COLUMNS = {
+    'slug': 'slug',
+    'name': 'name',
+    'category': 'category__slug',
+    'price': 'price',
+    'stock': 'stock',
+    'available': 'available',
+    'featured': 'featured',
+    'image': 'image',
+    'description': 'description',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+class Echo:
+    """File-like object whose write() hands the encoded line back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def filter_orders(queryset, params):
+    """Apply the from/to (inclusive dates) and status filters of a query dict"""
+    start = _parse_day(params.get('from'), 'from')
+    end = _parse_day(params.get('to'), 'to')
+    # Datetime ranges rather than __date lookups, so an index on created_at applies
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end + datetime.timedelta(days=1))
+
+    statuses = [status for status in params.getlist('status') if status]
+    if statuses:
+        valid = dict(Order.ORDER_STATUS_CHOICES)
+        unknown = [status for status in statuses if status not in valid]
+        if unknown:
+            raise ExportError(f"Unknown status: {', '.join(unknown)}")
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def _parse_day(value, name):
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ExportError(f'{name} must be a date as YYYY-MM-DD')
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def order_rows(queryset):
+    """One row per order line; orders without lines still appear once"""
+    lookups = list(ORDER_COLUMNS.values())
+    rows = queryset.values_list(*lookups).order_by('id', 'items__id')
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(ORDER_COLUMNS, row))
+
+
+def product_rows(queryset):
+    rows = queryset.values_list(*PRODUCT_COLUMNS.values()).order_by('id')
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(PRODUCT_COLUMNS, row))
+
+
+def encode_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row.values())
+
+
+def encode_jsonl(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def streaming_export(kind, queryset, fmt='csv'):
+    """Build a StreamingHttpResponse exporting queryset (orders or products) as fmt"""
+    if fmt not in FORMATS:
+        raise ExportError(f"Format must be one of: {', '.join(FORMATS)}")
+    if kind == 'orders':
+        columns, rows = ORDER_COLUMNS, order_rows(queryset)
+    else:
+        columns, rows = PRODUCT_COLUMNS, product_rows(queryset)
+
+    chunks = encode_csv(list(columns), rows) if fmt == 'csv' else encode_jsonl(rows)
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{kind}-{stamp}.{fmt}"'
+    return response
+
+
+def export_orders(params, queryset=None):
+    queryset = Order.objects.all() if queryset is None else queryset
+    return streaming_export('orders', filter_orders(queryset, params), params.get('format', 'csv'))
+
+
+def export_products(params, queryset=None):
+    queryset = Product.objects.all() if queryset is None else queryset
+    if params.get('category'):
+        queryset = queryset.filter(category__slug=params['category'])
+    if params.get('available') in ('0', '1'):
+        queryset = queryset.filter(available=params['available'] == '1')
+    return streaming_export('products', queryset, params.get('format', 'csv'))
@@ -1,4 +1,5 @@
 from django import forms
+from . import bulk
 from .models import Order
 
 PRODUCT_QUANTITY_CHOICES = [(i, str(i)) for i in range(1, 21)]
@@ -29,4 +30,61 @@ class OrderCreateForm(forms.ModelForm):
             'postal_code': forms.TextInput(attrs={'class': 'form-control'}),
             'city': forms.TextInput(attrs={'class': 'form-control'}),
             'country': forms.TextInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+class ProductBulkUpdateForm(forms.Form):
+    PRICE_CHOICES = [
+        ('', 'Leave unchanged'),
+        ('percent', 'Change by percent'),
+        ('amount', 'Change by amount'),
+        ('set', 'Set to'),
+    ]
+    STOCK_CHOICES = [
+        ('', 'Leave unchanged'),
+        ('delta', 'Add (or remove) units'),
+        ('set', 'Set to'),
+    ]
+    FLAG_CHOICES = [
+        ('', 'Leave unchanged'),
+        ('1', 'Yes'),
+        ('0', 'No'),
+    ]
+
+    price_mode = forms.ChoiceField(choices=PRICE_CHOICES, required=False, label='Price')
+    price_value = forms.DecimalField(max_digits=10, decimal_places=2, required=False, label='Price value')
+    stock_mode = forms.ChoiceField(choices=STOCK_CHOICES, required=False, label='Stock')
+    stock_value = forms.IntegerField(required=False, label='Stock value')
+    available = forms.ChoiceField(choices=FLAG_CHOICES, required=False)
+    featured = forms.ChoiceField(choices=FLAG_CHOICES, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for mode, value in [('price_mode', 'price_value'), ('stock_mode', 'stock_value')]:
+            if cleaned_data.get(mode) and cleaned_data.get(value) is None:
+                self.add_error(value, 'Enter a value for this change.')
+        if cleaned_data.get('price_mode') == 'set' and (cleaned_data.get('price_value') or 0) < 0:
+            self.add_error('price_value', 'Prices cannot be negative.')
+        if cleaned_data.get('stock_mode') == 'set' and (cleaned_data.get('stock_value') or 0) < 0:
+            self.add_error('stock_value', 'Stock cannot be negative.')
+        if not any(cleaned_data.get(field) for field in ['price_mode', 'stock_mode', 'available', 'featured']):
+            raise forms.ValidationError('Choose at least one change.')
+        return cleaned_data
+
+    def get_changes(self):
+        """Field -> value or expression, for shop.bulk.update_products()"""
+        data = self.cleaned_data
+        changes = {}
+        if data['price_mode'] == 'percent':
+            changes['price'] = bulk.price_by_percent(data['price_value'])
+        elif data['price_mode'] == 'amount':
+            changes['price'] = bulk.price_by_amount(data['price_value'])
+        elif data['price_mode'] == 'set':
+            changes['price'] = data['price_value']
+        if data['stock_mode'] == 'delta':
+            changes['stock'] = bulk.stock_by_delta(data['stock_value'])
+        elif data['stock_mode'] == 'set':
+            changes['stock'] = data['stock_value']
+        for flag in ['available', 'featured']:
+            if data[flag]:
+                changes[flag] = data[flag] == '1'
+        return changes
@@ -0,0 +1,319 @@
+"""
+Product images: originals kept locally, resized variants served from MEDIA_ROOT.
+
+Product.image stays the source, an http(s) URL or a path under MEDIA_URL.
+ingest() fetches it once, keeps the original as products/originals/<hash>.<ext>
+and writes a JPEG and a WebP copy at every PRODUCT_IMAGE_WIDTHS width narrower
+than the original (plus the original width, if it is narrower than the
+widest): products/<hash[:2]>/<hash>-<width>.<ext>. The hash comes from the
+SHA-256 of the original's bytes, so identical images share files, files are
+never rewritten, and their URLs can be cached for good (see
+shop.middleware.StaticFilesMiddleware).
+
+Product.image_variants records the source it was built from, the hash, the
+original size and the widths. The product_image template tag renders
+srcsets from it, and falls back to the bare source when it was built from
+another image or not at all.
+
+ingest() works on plain values and touches neither settings nor the
+database, so it runs in worker processes: VariantBuilder spreads products
+over a process pool and saves the results in bulk. A product saved in the
+admin is queued on a background thread instead, so the request does not
+wait for the download and the encodes; until the variants are saved the
+page shows the source, and `manage.py build_images` catches up on any
+product whose queued build was lost to a restart.
+"""
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from .catalog_cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+ORIGINALS_DIR = 'products/originals'
+VARIANTS_DIR = 'products'
+# Format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'method': 4}),
+    'jpeg': ('jpg', {'optimize': True, 'progressive': True}),
+}
+
+
+# One thread: queued builds run one after another, off the request
+_queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix='product-images')
+
+
+class ImageError(ValueError):
+    pass
+
+
+def pipeline_options():
+    """The settings ingest() needs, as plain values for worker processes"""
+    return {
+        'media_root': str(settings.MEDIA_ROOT),
+        'media_url': settings.MEDIA_URL,
+        'widths': sorted(settings.PRODUCT_IMAGE_WIDTHS),
+        'quality': settings.PRODUCT_IMAGE_QUALITY,
+        'max_bytes': settings.PRODUCT_IMAGE_MAX_BYTES,
+        'timeout': settings.PRODUCT_IMAGE_FETCH_TIMEOUT,
+    }
+
+
+def variant_name(digest, width, fmt):
+    return f'{VARIANTS_DIR}/{digest[:2]}/{digest}-{width}.{FORMATS[fmt][0]}'
+
+
+def variant_url(variants, width, fmt):
+    return settings.MEDIA_URL + variant_name(variants['hash'], width, fmt)
+
+
+def current_variants(product):
+    """The product's variants if they were built from its current image, else None"""
+    variants = product.image_variants
+    if product.image and variants and variants.get('source') == product.image:
+        return variants
+    return None
+
+
+def read_source(source, options):
+    """The bytes of source: downloaded from a URL, or read from under MEDIA_ROOT"""
+    limit = options['max_bytes']
+    if source.startswith(('http://', 'https://')):
+        request = urllib.request.Request(source, headers={'User-Agent': 'shop-image-pipeline'})
+        try:
+            with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                data = response.read(limit + 1)
+        except (urllib.error.URLError, OSError) as e:
+            raise ImageError(f'cannot fetch {source}: {getattr(e, "reason", e)}')
+    else:
+        if not source.startswith(options['media_url']):
+            raise ImageError(f'{source} is neither a URL nor under {options["media_url"]}')
+        root = Path(options['media_root']).resolve()
+        path = (root / source[len(options['media_url']):]).resolve()
+        if not path.is_relative_to(root):
+            raise ImageError(f'{source} is outside MEDIA_ROOT')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(limit + 1)
+        except OSError as e:
+            raise ImageError(f'cannot read {source}: {e.strerror}')
+    if len(data) > limit:
+        raise ImageError(f'{source} is larger than {limit} bytes')
+    return data
+
+
+def _write(path, save):
+    """Write path through a temporary file, so readers never see half an image"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save(f)
+        # mkstemp() creates 0600 files; match FileSystemStorage's default
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _flatten(image):
+    """RGB copy of image, transparency composited onto white"""
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _save(image, path, fmt, quality):
+    _write(path, lambda f: image.save(f, fmt.upper(), quality=quality, **FORMATS[fmt][1]))
+
+
+def ingest(source, options):
+    """Keep the original of source and write its missing variants; returns the image_variants value"""
+    data = read_source(source, options)
+    # 64 bits of SHA-256 keep the srcsets short and collisions out of reach
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    root = Path(options['media_root'])
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Only the header is read so far: the size is known without
+            # decoding, which a re-run with every file present skips
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+                width, height = height, width
+            widths = [w for w in options['widths'] if w < width]
+            if width <= options['widths'][-1]:
+                widths.append(width)
+
+            extension = FORMATS['jpeg'][0] if image.format == 'JPEG' else (image.format or 'img').lower()
+            original = root / ORIGINALS_DIR / f'{digest}.{extension}'
+            if not original.exists():
+                _write(original, lambda f: f.write(data))
+
+            missing = [
+                (w, fmt) for w in widths for fmt in FORMATS
+                if not (root / variant_name(digest, w, fmt)).exists()
+            ]
+            if missing:
+                # JPEGs decode straight to a reduced scale, no smaller than needed
+                scale = max(w for w, _ in missing) / width
+                image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+                resized = _flatten(ImageOps.exif_transpose(image))
+                # Widest first, each variant resized from the one before
+                for w in sorted({w for w, _ in missing}, reverse=True):
+                    size = (w, max(1, round(height * w / width)))
+                    if resized.size != size:
+                        resized = resized.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                    for fmt in FORMATS:
+                        if (w, fmt) in missing:
+                            _save(resized, root / variant_name(digest, w, fmt), fmt, options['quality'])
+    except UnidentifiedImageError:
+        raise ImageError(f'{source} is not an image Pillow can read')
+    except Image.DecompressionBombError as e:
+        raise ImageError(f'{source} is too large: {e}')
+    except OSError as e:
+        raise ImageError(f'cannot process {source}: {e}')
+
+    return {
+        'source': source,
+        'hash': digest,
+        'original': f'{ORIGINALS_DIR}/{digest}.{extension}',
+        'width': width,
+        'height': height,
+        'widths': widths,
+    }
+
+
+def _ingest_product(pk, source, options):
+    """Worker entry point: (pk, variants or None, error or None)"""
+    try:
+        return pk, ingest(source, options), None
+    except ImageError as e:
+        return pk, None, str(e)
+
+
+def save_variants(results):
+    """Store {pk: variants} on the products in one bulk update"""
+    from .models import Product
+
+    if not results:
+        return 0
+    now = timezone.now()
+    products = [Product(pk=pk, image_variants=variants, updated_at=now) for pk, variants in results.items()]
+    # bulk_update() skips the post_save signals: updated_at changes the
+    # pages' validators, and the catalog cache is bumped by hand
+    with transaction.atomic():
+        Product.objects.bulk_update(products, ['image_variants', 'updated_at'], batch_size=500)
+    bump_catalog_version()
+    return len(products)
+
+
+def build_product_variants(product):
+    """Ingest one product's image in this process and save the result; raises ImageError"""
+    variants = ingest(product.image, pipeline_options())
+    save_variants({product.pk: variants})
+    product.image_variants = variants
+    return variants
+
+
+def _build_queued(pk):
+    from .models import Product
+
+    try:
+        product = Product.objects.only('id', 'image', 'image_variants').get(pk=pk)
+        # The image may have changed or been built since it was queued
+        if product.image and current_variants(product) is None:
+            build_product_variants(product)
+    except Product.DoesNotExist:
+        pass
+    except ImageError as e:
+        logger.warning('Could not resize the image of product %s: %s', pk, e)
+    except Exception:
+        logger.exception('Resizing the image of product %s failed', pk)
+    finally:
+        connections.close_all()
+
+
+def queue_product_variants(pk):
+    """Build a product's variants on the background thread once the current transaction commits"""
+    transaction.on_commit(lambda: _queue.submit(_build_queued, pk))
+
+
+class VariantBuilder:
+    """
+    Build variants in a pool of worker processes while the caller goes on.
+
+    submit() queues (pk, source) pairs, collect() saves whatever has
+    finished, and leaving the with block waits for the rest. Workers are
+    spawned rather than forked: the parent holds database connections and
+    pool threads that a fork would copy mid-use.
+    """
+
+    def __init__(self, workers=None, save_every=200, on_error=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.save_every = save_every
+        self.on_error = on_error
+        self.options = pipeline_options()
+        self.pending = set()
+        self.results = {}
+        self.stats = {'built': 0, 'failed': 0}
+        self.executor = None
+
+    def __enter__(self):
+        self.executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+        )
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.collect(wait_all=True)
+        finally:
+            self.executor.shutdown(cancel_futures=exc_type is not None)
+
+    def submit(self, products):
+        for pk, source in products:
+            self.pending.add(self.executor.submit(_ingest_product, pk, source, self.options))
+            # Bound the queue so a large load does not hold every future at once
+            if len(self.pending) >= self.workers * 4:
+                self.collect(wait_for_one=True)
+
+    def collect(self, wait_all=False, wait_for_one=False):
+        """Save finished results, every save_every of them or all at the end"""
+        if wait_all:
+            done, self.pending = wait(self.pending).done, set()
+        elif wait_for_one:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+        else:
+            done = {future for future in self.pending if future.done()}
+            self.pending -= done
+        for future in done:
+            pk, variants, error = future.result()
+            if error:
+                self.stats['failed'] += 1
+                if self.on_error:
+                    self.on_error(pk, error)
+            else:
+                self.results[pk] = variants
+        if self.results and (wait_all or len(self.results) >= self.save_every):
+            self.stats['built'] += save_variants(self.results)
+            self.results = {}
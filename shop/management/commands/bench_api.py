@@ -0,0 +1,117 @@
+import gzip
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import reverse
+
+from shop import benchmark
+from shop.models import Cart, CartItem, Product
+
+SCENARIOS = ['product_list', 'product_detail', 'cart']
+
+
+class Command(BaseCommand):
+    help = 'Compare payload size and latency of the JSON API with the HTML pages it replaces'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario and format')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario and format')
+        parser.add_argument('--fields', default='id,name,price', help='Sparse fieldset for the extra API runs')
+        parser.add_argument('--cart-size', type=int, default=5, help='Lines in the cart for the cart scenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Only run these scenarios')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.products = self.sample_products(500)
+        if not self.products:
+            raise CommandError('No available products; run seed_bench first.')
+
+        self.client = Client(SERVER_NAME='localhost')
+        user, _ = User.objects.get_or_create(username='bench-runner', defaults={'password': '!'})
+        self.client.force_login(user)
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.filter(cart=cart).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product['id'], quantity=1)
+            for product in self.rng.sample(self.products, min(options['cart_size'], len(self.products)))
+        ])
+
+        results = {}
+        for name in options['scenario'] or SCENARIOS:
+            for variant, url_for in getattr(self, f'scenario_{name}')(options['fields']).items():
+                results[f'{name} ({variant})'] = self.run(url_for, options['requests'], options['warmup'])
+
+        self.stdout.write(benchmark.format_table(results))
+        self.stdout.write('')
+        header = f"{'scenario':<34}{'bytes':>10}{'gzip bytes':>12}{'vs html':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, result in results.items():
+            html = results.get(f"{name.split(' ')[0]} (html)")
+            ratio = f"{result['bytes'] / html['bytes'] * 100:.0f}%" if html and html['bytes'] else ''
+            self.stdout.write(f"{name:<34}{result['bytes']:>10.0f}{result['gzip_bytes']:>12.0f}{ratio:>9}")
+
+        if options['output']:
+            benchmark.save_results(
+                options['output'], results,
+                vendor=connection.vendor,
+                products=Product.objects.count(),
+                requests=options['requests'],
+                fields=options['fields'],
+            )
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def sample_products(self, size):
+        available = Product.objects.filter(available=True)
+        bounds = available.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return []
+        ids = [self.rng.randint(bounds['low'], bounds['high']) for _ in range(size)]
+        return list(available.filter(id__in=ids).values('id', 'slug', 'category__slug'))
+
+    def run(self, url_for, requests, warmup):
+        sizes = []
+
+        def action():
+            url = url_for()
+            response = self.client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'GET {url} returned {response.status_code}')
+            sizes.append((len(response.content), len(gzip.compress(response.content, 6))))
+
+        result = benchmark.measure(action, requests, warmup=warmup)
+        sizes = sizes[warmup:]
+        result['bytes'] = round(sum(size for size, _ in sizes) / len(sizes), 1)
+        result['gzip_bytes'] = round(sum(size for _, size in sizes) / len(sizes), 1)
+        return result
+
+    def pick(self):
+        return self.rng.choice(self.products)
+
+    def scenario_product_list(self, fields):
+        html = reverse('shop:product_list_by_category', args=['SLUG'])
+        api = reverse('shop:api_products') + '?category=SLUG'
+        return {
+            'html': lambda: html.replace('SLUG', self.pick()['category__slug']),
+            'json': lambda: api.replace('SLUG', self.pick()['category__slug']),
+            'json sparse': lambda: api.replace('SLUG', self.pick()['category__slug']) + f'&fields={fields}',
+        }
+
+    def scenario_product_detail(self, fields):
+        return {
+            'html': lambda: reverse('shop:product_detail', args=[self.pick()['slug']]),
+            'json': lambda: reverse('shop:api_product', args=[self.pick()['slug']]),
+            'json sparse': lambda: reverse('shop:api_product', args=[self.pick()['slug']]) + f'?fields={fields}',
+        }
+
+    def scenario_cart(self, fields):
+        return {
+            'html': lambda: reverse('shop:cart_detail'),
+            'json': lambda: reverse('shop:api_cart'),
+        }
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from shop import benchmark
+from shop.models import Product
+
+SCENARIOS = ['home', 'product_list', 'product_detail', 'cart_detail']
+SERVERS = {
+    'wsgi': ['ecommerce.wsgi:application'],
+    'asgi': ['ecommerce.asgi:application', '--worker-class', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare sync (WSGI) and async (ASGI) serving of the catalog pages against a slow database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency-ms', type=float, default=50.0, help='Delay added to every SQL query')
+        parser.add_argument('--requests', type=int, default=400, help='Timed requests per scenario and mode')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once')
+        parser.add_argument('--workers', type=int, default=2, help='Server processes in both modes')
+        parser.add_argument('--mode', action='append', choices=list(SERVERS), help='Only run these modes')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Only run these scenarios')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--keep-cache', action='store_true',
+            help='Leave the catalog cache on; by default every request goes to the database',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.paths = self.scenario_paths(options['scenario'] or SCENARIOS)
+
+        results = {}
+        for mode in options['mode'] or list(SERVERS):
+            server = self.start_server(mode)
+            try:
+                for name, paths in self.paths.items():
+                    asyncio.run(self.load(paths, len(paths)))  # warm up
+                    results[f'{name} ({mode})'] = asyncio.run(self.load(paths, options['requests']))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        self.stdout.write(
+            f"{options['latency_ms']:.0f} ms per query, {options['concurrency']} concurrent clients, "
+            f"{options['workers']} workers per mode"
+        )
+        self.stdout.write(benchmark.format_table(results))
+        for name in self.paths:
+            sync, async_ = results.get(f'{name} (wsgi)'), results.get(f'{name} (asgi)')
+            if sync and async_ and sync['throughput_rps']:
+                ratio = async_['throughput_rps'] / sync['throughput_rps']
+                self.stdout.write(f'{name}: async serves {ratio:.1f}x the requests per second of sync')
+
+        if options['output']:
+            benchmark.save_results(
+                options['output'], results,
+                latency_ms=options['latency_ms'],
+                concurrency=options['concurrency'],
+                workers=options['workers'],
+            )
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def scenario_paths(self, scenarios):
+        products = list(Product.objects.filter(available=True).values('slug', 'category__slug')[:500])
+        if not products:
+            raise CommandError('No available products; run seed_bench first.')
+        self.rng.shuffle(products)
+        paths = {
+            'home': [reverse('shop:home')],
+            'product_list': [
+                reverse('shop:product_list_by_category', args=[p['category__slug']]) for p in products[:50]
+            ],
+            'product_detail': [reverse('shop:product_detail', args=[p['slug']]) for p in products[:50]],
+            'cart_detail': [reverse('shop:cart_detail')],
+        }
+        return {name: paths[name] for name in scenarios}
+
+    def start_server(self, mode):
+        env = {
+            **os.environ,
+            'SERVER_MODE': mode,
+            'BENCH_DB_LATENCY_MS': str(self.options['latency_ms']),
+            'REQUEST_TIMING': 'False',
+        }
+        if not self.options['keep_cache']:
+            env['CATALOG_CACHE_TIMEOUT'] = '0'
+        command = [
+            sys.executable, '-m', 'gunicorn', *SERVERS[mode],
+            '--workers', str(self.options['workers']),
+            '--bind', f"127.0.0.1:{self.options['port']}",
+            '--log-level', 'warning',
+        ]
+        self.stdout.write(f"Starting {mode} server: {' '.join(command[2:])}")
+        server = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'The {mode} server exited with status {server.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', self.options['port']), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'The {mode} server did not start listening within 30s')
+
+    async def load(self, paths, total):
+        """Make total GETs cycling through paths, --concurrency at a time, returning the summary"""
+        semaphore = asyncio.Semaphore(self.options['concurrency'])
+        latencies = []
+
+        async def fetch(path):
+            async with semaphore:
+                start = time.perf_counter()
+                reader, writer = await asyncio.open_connection('127.0.0.1', self.options['port'])
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                latencies.append(time.perf_counter() - start)
+            status = response.split(b' ', 2)[1] if response else b'no response'
+            if status != b'200':
+                raise CommandError(f'GET {path} returned {status.decode()}')
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch(paths[i % len(paths)]) for i in range(total)))
+        return benchmark.summarize(latencies, time.perf_counter() - start)
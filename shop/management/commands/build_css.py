@@ -0,0 +1,51 @@
+import gzip
+import shutil
+import subprocess
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SOURCE = settings.BASE_DIR / 'assets' / 'css' / 'shop.css'
+OUTPUT = settings.BASE_DIR / 'static' / 'css' / 'shop.css'
+
+
+def find_tailwindcss():
+    try:
+        from tailwindcss_bin import TailwindcssNotFound, find_tailwindcss_bin
+    except ImportError:
+        return shutil.which('tailwindcss')
+    try:
+        return find_tailwindcss_bin()
+    except TailwindcssNotFound:
+        return shutil.which('tailwindcss')
+
+
+class Command(BaseCommand):
+    help = 'Build the minified storefront stylesheet from the Tailwind classes used in the templates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Rebuild whenever a template or script changes (unminified)',
+        )
+
+    def handle(self, *args, **options):
+        tailwindcss = find_tailwindcss()
+        if tailwindcss is None:
+            raise CommandError('The Tailwind CLI is missing; pip install -r requirements-build.txt')
+
+        command = [tailwindcss, '--input', str(SOURCE), '--output', str(OUTPUT), '--cwd', str(settings.BASE_DIR)]
+        command.append('--watch' if options['watch'] else '--minify')
+        try:
+            subprocess.run(command, check=True)
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f'tailwindcss exited with status {e.returncode}')
+        except KeyboardInterrupt:
+            return
+
+        data = OUTPUT.read_bytes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {OUTPUT.relative_to(settings.BASE_DIR)}: {len(data)} bytes, '
+            f'{len(gzip.compress(data, 9))} gzipped, {len(brotli.compress(data))} with brotli'
+        ))
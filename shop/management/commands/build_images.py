@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.images import VariantBuilder
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Build the resized image variants of products that lack them, in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Products read per query (default: 1000)',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild every product, e.g. after PRODUCT_IMAGE_WIDTHS changed; existing files are kept',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        queued = 0
+        products = Product.objects.filter(image__gt='').order_by('id')
+
+        with VariantBuilder(options['workers'], on_error=self.report_error) as builder:
+            last_id = 0
+            while batch := list(products.filter(id__gt=last_id).values('id', 'image', 'image_variants')[:options['batch_size']]):
+                last_id = batch[-1]['id']
+                stale = [
+                    (product['id'], product['image']) for product in batch
+                    if options['all'] or product['image_variants'].get('source') != product['image']
+                ]
+                queued += len(stale)
+                builder.submit(stale)
+                builder.collect()
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Queued {queued} products, {builder.stats['built']} saved...")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Resized images of {built} products, {failed} failed'.format(**builder.stats) + f' in {elapsed:.1f}s'
+        ))
+
+    def report_error(self, pk, message):
+        self.stderr.write(f'product {pk}: {message}')
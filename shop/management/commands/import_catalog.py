@@ -0,0 +1,267 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import time
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+from django.db import transaction
+
+from shop import search
+from shop.images import VariantBuilder
+from shop.catalog_cache import bump_catalog_version
+from shop.counts import CountDeltas
+from shop.models import Category, Product
+
+FIELDS = ['name', 'description', 'price', 'stock', 'image', 'available', 'featured']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class RowError(ValueError):
+    pass
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(path, fmt):
+    """Yield (row, error) for every record of a CSV or JSONL file, one at a time"""
+    with open_text(path) as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield row, None
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield None, f'invalid JSON ({e.msg})'
+                    continue
+                if not isinstance(row, dict):
+                    yield None, 'expected a JSON object'
+                    continue
+                yield row, None
+
+
+def parse_bool(value, default):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f'invalid boolean {value!r}')
+
+
+def content_hash(values):
+    payload = json.dumps([str(values[field]) for field in ['category_id'] + FIELDS])
+    return hashlib.md5(payload.encode(), usedforsecurity=False).hexdigest()
+
+
+class Command(BaseCommand):
+    help = 'Stream products from CSV or JSONL files and upsert them by slug in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='CSV or JSONL files (optionally .gz)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--create-categories', action='store_true',
+            help='Create categories for unknown slugs instead of rejecting the row',
+        )
+        parser.add_argument('--max-errors-shown', type=int, default=100)
+        parser.add_argument(
+            '--image-workers', type=int,
+            help='Processes resizing product images while rows load (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--skip-images', action='store_true',
+            help='Leave image variants to a later build_images run',
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.create_categories = options['create_categories']
+        self.max_errors_shown = options['max_errors_shown']
+        self.verbosity = options['verbosity']
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        started = time.monotonic()
+
+        self.images = None if options['skip_images'] else VariantBuilder(
+            options['image_workers'], on_error=self.report_image_error,
+        )
+        with self.images or nullcontext():
+            for path in options['paths']:
+                fmt = options['format'] or self.detect_format(path)
+                self.import_file(path, fmt)
+
+        if self.stats['inserted'] or self.stats['updated']:
+            bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        rate = self.stats['read'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            'Read {read} rows: {inserted} inserted, {updated} updated, {unchanged} unchanged, '
+            '{errors} errors'.format(**self.stats) + f' in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
+        if self.images:
+            self.stdout.write('Images: {built} resized, {failed} failed'.format(**self.images.stats))
+
+    def detect_format(self, path):
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        raise CommandError(f'Cannot tell the format of {path}; pass --format')
+
+    def import_file(self, path, fmt):
+        rows = read_rows(path, fmt)
+        row_number = 0
+        while chunk := list(islice(rows, self.batch_size)):
+            batch = {}
+            for row, error in chunk:
+                row_number += 1
+                if error:
+                    self.report_error(path, row_number, error)
+                    continue
+                try:
+                    values = self.clean(row)
+                except RowError as e:
+                    self.report_error(path, row_number, str(e))
+                    continue
+                # A slug repeated within a batch keeps its last version
+                batch[values['slug']] = values
+            self.stats['read'] += len(chunk)
+            if batch:
+                self.write_batch(batch)
+            if self.verbosity > 1:
+                self.stdout.write(f'  {path}: {row_number} rows')
+
+    def clean(self, row):
+        def text(field, required=False, max_length=None):
+            value = row.get(field)
+            value = '' if value is None else str(value).strip()
+            if required and not value:
+                raise RowError(f'{field} is required')
+            if max_length and len(value) > max_length:
+                raise RowError(f'{field} is longer than {max_length} characters')
+            return value
+
+        slug = text('slug', required=True, max_length=200)
+        try:
+            validate_slug(slug)
+        except ValidationError:
+            raise RowError(f'invalid slug {slug!r}')
+
+        try:
+            price = Decimal(text('price', required=True)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise RowError(f"invalid price {row.get('price')!r}")
+        if price < 0 or price >= Decimal('100000000'):
+            raise RowError(f'price {price} out of range')
+
+        try:
+            stock = int(text('stock') or 0)
+        except ValueError:
+            raise RowError(f"invalid stock {row.get('stock')!r}")
+        if stock < 0:
+            raise RowError('stock cannot be negative')
+
+        return {
+            'slug': slug,
+            'category_id': self.category_id(text('category', required=True, max_length=200)),
+            'name': text('name', required=True, max_length=200),
+            'description': text('description'),
+            'price': price,
+            'stock': stock,
+            'image': text('image', max_length=200) or None,
+            'available': parse_bool(row.get('available'), True),
+            'featured': parse_bool(row.get('featured'), False),
+        }
+
+    def category_id(self, slug):
+        if slug not in self.categories:
+            if not self.create_categories:
+                raise RowError(f'unknown category {slug!r}')
+            try:
+                validate_slug(slug)
+            except ValidationError:
+                raise RowError(f'invalid category slug {slug!r}')
+            category, _ = Category.objects.get_or_create(
+                slug=slug, defaults={'name': slug.replace('-', ' ').title()}
+            )
+            self.categories[slug] = category.id
+        return self.categories[slug]
+
+    def write_batch(self, batch):
+        existing = {}
+        counted = {}
+        for values in Product.objects.filter(slug__in=batch).values('slug', 'category_id', *FIELDS):
+            existing[values['slug']] = content_hash(values)
+            counted[values['slug']] = (values['category_id'], values['available'])
+        changed = [
+            values for slug, values in batch.items()
+            if existing.get(slug) != content_hash(values)
+        ]
+        self.stats['unchanged'] += len(batch) - len(changed)
+        if not changed:
+            return
+
+        with transaction.atomic():
+            products = Product.objects.bulk_create(
+                [Product(**values) for values in changed],
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=['category', 'updated_at'] + FIELDS,
+            )
+            pks = [product.pk for product in products]
+            if None in pks:
+                # Backends that cannot return ids from an upsert
+                pks = Product.objects.filter(slug__in=[values['slug'] for values in changed]).values_list('id', flat=True)
+            # bulk_create skips the post_save signals that maintain the index
+            # and the category counts
+            search.index_products(pks)
+            deltas = CountDeltas()
+            for values in changed:
+                deltas.change(counted.get(values['slug']), (values['category_id'], values['available']))
+            deltas.apply()
+
+        if self.images:
+            # Resized in the pool while the next batches load
+            self.images.submit([
+                (product['id'], product['image'])
+                for product in Product.objects.filter(pk__in=pks, image__gt='').values('id', 'image', 'image_variants')
+                if product['image_variants'].get('source') != product['image']
+            ])
+            self.images.collect()
+
+        inserted = sum(1 for values in changed if values['slug'] not in existing)
+        self.stats['inserted'] += inserted
+        self.stats['updated'] += len(changed) - inserted
+
+    def report_image_error(self, pk, message):
+        self.stderr.write(f'product {pk}: {message}')
+
+    def report_error(self, path, row_number, message):
+        self.stats['errors'] += 1
+        if self.stats['errors'] <= self.max_errors_shown:
+            self.stderr.write(f'{path} row {row_number}: {message}')
+        elif self.stats['errors'] == self.max_errors_shown + 1:
+            self.stderr.write('Further errors are counted but not shown')
@@ -0,0 +1,113 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from shop.models import Cart, CartItem
+
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+class Command(BaseCommand):
+    help = 'Delete idle carts (with their items and anonymous sessions) and expired sessions in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float, default=7,
+            help='Delete carts not updated for this many days (default: 7)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows deleted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='Seconds to pause between batches to leave room for live traffic (default: 0.1)',
+        )
+        parser.add_argument(
+            '--include-user-carts', action='store_true',
+            help='Also purge idle carts of registered users (default: anonymous carts only)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        carts = Cart.objects.filter(updated_at__lt=cutoff)
+        if not options['include_user_carts']:
+            carts = carts.filter(user__isnull=True)
+        sessions = None
+        if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+            sessions = Session.objects.filter(expire_date__lt=timezone.now())
+
+        if options['dry_run']:
+            self.stdout.write(f'Carts to delete: {carts.count()}')
+            self.stdout.write(f'Cart items to delete: {CartItem.objects.filter(cart__in=carts).count()}')
+            if sessions is not None:
+                cart_sessions = Session.objects.filter(pk__in=carts.filter(user__isnull=True).values('session_key'))
+                self.stdout.write(f'Sessions of those carts to delete: {cart_sessions.count()}')
+                self.stdout.write(f'Expired sessions to delete: {sessions.count()}')
+            return
+
+        self.purge(
+            'carts', carts, 'updated_at', options,
+            # Re-checked at delete time so a cart touched mid-run survives
+            lambda ids: self.delete_carts(Cart.objects.filter(id__in=ids, updated_at__lt=cutoff)),
+        )
+        if sessions is not None:
+            self.purge(
+                'sessions', sessions, 'expire_date', options,
+                lambda keys: Session.objects.filter(pk__in=keys).delete()[1],
+            )
+
+    def delete_carts(self, carts):
+        """Delete carts, and the sessions of the anonymous ones, which they would outlive"""
+        keys = []
+        if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+            keys = list(carts.filter(user__isnull=True, session_key__isnull=False).values_list('session_key', flat=True))
+        deleted = carts.delete()[1]
+        if keys:
+            deleted.update(Session.objects.filter(pk__in=keys).delete()[1])
+            if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db':
+                caches[settings.SESSION_CACHE_ALIAS].delete_many([KEY_PREFIX + key for key in keys])
+        return deleted
+
+    def purge(self, label, queryset, order_field, options, delete_batch):
+        """Walk queryset in index order, deleting one short transaction per batch"""
+        started = time.monotonic()
+        deleted = {}
+        batches = 0
+        while True:
+            keys = list(
+                queryset.order_by(order_field, 'pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            with transaction.atomic():
+                for model, count in delete_batch(keys).items():
+                    deleted[model] = deleted.get(model, 0) + count
+            batches += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{label}: batch {batches}, {sum(deleted.values())} rows deleted')
+            if len(keys) < options['batch_size']:
+                break
+            time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        total = sum(deleted.values())
+        rate = total / elapsed if elapsed else 0
+        details = ', '.join(f'{count} {model}' for model, count in sorted(deleted.items())) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {label}: {details} in {batches} batches, {elapsed:.2f}s ({rate:.0f} rows/s)'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of product ids indexed per statement (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for count in search.rebuild_index(batch_size=options['batch_size']):
+            total += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Indexed {total} products...')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {total} products in {elapsed:.2f}s')
+        )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import counts
+from shop.catalog_cache import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Recount the products of every category and fix the stored counts that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Categories locked and recounted per transaction (default: 1000)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        drifted = counts.reconcile(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for category, stored, actual in drifted:
+            self.stdout.write(
+                f'{category.name} (id {category.pk}): stored {stored[0]} products, {stored[1]} available; '
+                f'counted {actual[0]}, {actual[1]}'
+            )
+        if drifted and not options['dry_run']:
+            bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        verb = 'would fix' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{len(drifted)} categories drifted, {verb} in {elapsed:.2f}s'))
@@ -0,0 +1,135 @@
+import random
+import subprocess
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import reverse
+
+from shop import benchmark
+from shop.models import Cart, CartItem, Product
+
+SCENARIOS = ['home', 'product_list', 'product_detail', 'cart_add', 'cart_detail', 'order_create']
+ORDER_FORM = {
+    'first_name': 'Bench', 'last_name': 'Runner', 'email': 'runner@bench.example',
+    'address': '1 Bench Street', 'postal_code': '10001', 'city': 'Benchville', 'country': 'US',
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the storefront views through the Django test client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario')
+        parser.add_argument('--cart-size', type=int, default=5, help='Lines in the cart for cart and checkout scenarios')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Only run these scenarios')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Fail when p95 latency grows by more than this percentage over the baseline',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.cart_size = options['cart_size']
+        self.products = self.sample_products(500)
+        if not self.products:
+            raise CommandError('No available products; run seed_bench first.')
+
+        self.anonymous = Client(SERVER_NAME='localhost')
+        self.user, _ = User.objects.get_or_create(username='bench-runner', defaults={'password': '!'})
+        self.shopper = Client(SERVER_NAME='localhost')
+        self.shopper.force_login(self.user)
+        self.cart, _ = Cart.objects.get_or_create(user=self.user)
+
+        results = {}
+        for name in options['scenario'] or SCENARIOS:
+            action, setup = getattr(self, f'scenario_{name}')()
+            results[name] = benchmark.measure(action, options['requests'], setup=setup, warmup=options['warmup'])
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{name}: {results[name]}')
+
+        self.stdout.write(benchmark.format_table(results))
+
+        if options['output']:
+            benchmark.save_results(
+                options['output'], results,
+                vendor=connection.vendor,
+                products=Product.objects.count(),
+                requests=options['requests'],
+                cart_size=self.cart_size,
+                revision=self.git_revision(),
+            )
+            self.stdout.write(f"Saved results to {options['output']}")
+
+        if options['compare']:
+            lines, regressions = benchmark.compare(
+                results, benchmark.load_baseline(options['compare']), options['threshold']
+            )
+            self.stdout.write('\n'.join(lines))
+            if regressions:
+                raise CommandError(f"Regressions against baseline: {', '.join(regressions)}")
+
+    def sample_products(self, size):
+        available = Product.objects.filter(available=True)
+        bounds = available.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return []
+        ids = [self.rng.randint(bounds['low'], bounds['high']) for _ in range(size)]
+        return list(available.filter(id__in=ids).values('id', 'slug', 'category__slug'))
+
+    def fill_cart(self):
+        CartItem.objects.filter(cart=self.cart).delete()
+        lines = self.rng.sample(self.products, min(self.cart_size, len(self.products)))
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product_id=product['id'], quantity=1) for product in lines
+        ])
+
+    def get(self, client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'GET {url} returned {response.status_code}')
+
+    def scenario_home(self):
+        return lambda: self.get(self.anonymous, reverse('shop:home')), None
+
+    def scenario_product_list(self):
+        def action():
+            slug = self.rng.choice(self.products)['category__slug']
+            self.get(self.anonymous, reverse('shop:product_list_by_category', args=[slug]))
+        return action, None
+
+    def scenario_product_detail(self):
+        def action():
+            self.get(self.anonymous, reverse('shop:product_detail', args=[self.rng.choice(self.products)['slug']]))
+        return action, None
+
+    def scenario_cart_add(self):
+        def action():
+            product = self.rng.choice(self.products)
+            self.shopper.post(reverse('shop:cart_add', args=[product['id']]), {'quantity': 1})
+        return action, None
+
+    def scenario_cart_detail(self):
+        self.fill_cart()
+        return lambda: self.get(self.shopper, reverse('shop:cart_detail')), None
+
+    def scenario_order_create(self):
+        def action():
+            response = self.shopper.post(reverse('shop:order_create'), ORDER_FORM)
+            if response.status_code != 302 or 'order' not in response['Location']:
+                raise CommandError(f'Checkout failed with status {response.status_code}')
+        return action, self.fill_cart
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,155 @@
+import random
+import time
+from array import array
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from shop import search
+from shop.catalog_cache import bump_catalog_version
+from shop.counts import CountDeltas, product_state
+from shop.models import Cart, CartItem, Category, Order, OrderItem, Product
+
+PREFIX = 'bench-'
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic catalog, carts and orders for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--carts', type=int, default=100000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--items-per-cart', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible datasets')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded bench data first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        started = time.monotonic()
+
+        if options['products'] and not options['categories']:
+            raise CommandError('--products needs at least one category')
+        if options['orders'] and not options['users']:
+            raise CommandError('--orders needs at least one user')
+
+        if options['clear']:
+            self.clear()
+
+        category_ids = self.insert(
+            'categories', Category, range(options['categories']),
+            lambda i: Category(name=f'Bench Category {i}', slug=f'{PREFIX}category-{i}',
+                               description=f'Synthetic category {i}'),
+        )
+        self.count_deltas = CountDeltas()
+        product_ids = self.insert(
+            'products', Product, range(options['products']), self.make_product(category_ids),
+        )
+        user_ids = self.insert(
+            'users', User, range(options['users']),
+            lambda i: User(username=f'{PREFIX}user-{i}', email=f'user{i}@bench.example', password='!'),
+        )
+        cart_ids = self.insert(
+            'carts', Cart, range(options['carts']),
+            lambda i: Cart(session_key=f'{PREFIX}{i:034d}'),
+        )
+        self.insert(
+            'cart items', CartItem, self.cart_lines(cart_ids, product_ids, options['items_per_cart']),
+            lambda line: CartItem(cart_id=line[0], product_id=line[1], quantity=line[2]),
+        )
+        order_ids = self.insert(
+            'orders', Order, range(options['orders']),
+            lambda i: Order(
+                user_id=self.rng.choice(user_ids), first_name='Bench', last_name=f'User {i}',
+                email=f'order{i}@bench.example', address=f'{i} Bench Street', postal_code='10001',
+                city='Benchville', country='US', total_amount=Decimal('0.00'),
+                status=self.rng.choice(['pending', 'processing', 'shipped', 'delivered']),
+            ),
+        )
+        self.insert(
+            'order items', OrderItem, self.cart_lines(order_ids, product_ids, options['items_per_cart']),
+            lambda line: OrderItem(order_id=line[0], product_id=line[1], quantity=line[2],
+                                   price=Decimal(self.rng.randint(100, 99999)) / 100),
+        )
+
+        # bulk_create skips signals, so refresh what they would have maintained
+        for _ in search.rebuild_index(batch_size=self.batch_size * 10):
+            pass
+        self.count_deltas.apply()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded bench data in {time.monotonic() - started:.1f}s'))
+
+    def make_product(self, category_ids):
+        def build(i):
+            product = Product(
+                category_id=category_ids[i % len(category_ids)],
+                name=f'Bench Product {i}',
+                slug=f'{PREFIX}product-{i}',
+                description=f'Synthetic product {i} for load testing the catalog.',
+                price=Decimal(self.rng.randint(100, 99999)) / 100,
+                stock=1000000,
+                available=self.rng.random() < 0.95,
+                featured=self.rng.random() < 0.001,
+            )
+            self.count_deltas.change(None, product_state(product))
+            return product
+        return build
+
+    def cart_lines(self, parent_ids, product_ids, per_parent):
+        for parent_id in parent_ids:
+            for product_id in set(self.rng.choice(product_ids) for _ in range(per_parent)):
+                yield parent_id, product_id, self.rng.randint(1, 5)
+
+    def insert(self, label, model, source, build):
+        """bulk_create build(x) for every x in source, returning the new primary keys"""
+        started = time.monotonic()
+        ids = array('q')
+        for batch in batched(source, self.batch_size):
+            with transaction.atomic():
+                objs = model.objects.bulk_create([build(x) for x in batch])
+            ids.extend(obj.pk for obj in objs)
+            if self.verbosity > 1:
+                self.stdout.write(f'  {label}: {len(ids)}')
+        elapsed = time.monotonic() - started
+        rate = len(ids) / elapsed if elapsed else 0
+        self.stdout.write(f'Inserted {len(ids)} {label} in {elapsed:.1f}s ({rate:.0f} rows/s)')
+        return ids
+
+    def clear(self):
+        # Plain DELETEs in dependency order: going through the ORM would load
+        # every row and fire the Product signals once per product
+        self.stdout.write('Deleting previous bench data...')
+        like = PREFIX + '%'
+        products = f'SELECT id FROM {Product._meta.db_table} WHERE slug LIKE %s'
+        users = f'SELECT id FROM {User._meta.db_table} WHERE username LIKE %s'
+        orders = f'SELECT id FROM {Order._meta.db_table} WHERE user_id IN ({users})'
+        carts = f'SELECT id FROM {Cart._meta.db_table} WHERE session_key LIKE %s OR user_id IN ({users})'
+        statements = [
+            (f'DELETE FROM {OrderItem._meta.db_table} WHERE order_id IN ({orders}) OR product_id IN ({products})',
+             [like, like]),
+            (f'DELETE FROM {CartItem._meta.db_table} WHERE cart_id IN ({carts}) OR product_id IN ({products})',
+             [like, like, like]),
+            (f'DELETE FROM {Order._meta.db_table} WHERE user_id IN ({users})', [like]),
+            (f'DELETE FROM {Cart._meta.db_table} WHERE session_key LIKE %s OR user_id IN ({users})', [like, like]),
+            (f'DELETE FROM {Product._meta.db_table} WHERE slug LIKE %s', [like]),
+            (f'DELETE FROM {Category._meta.db_table} WHERE slug LIKE %s', [like]),
+            (f'DELETE FROM {User._meta.db_table} WHERE username LIKE %s', [like]),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(sql, params)
@@ -0,0 +1,91 @@
+import json
+import re
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+STYLESHEET_RE = re.compile(r'<link\b[^>]*\brel="stylesheet"[^>]*\bhref="([^"]+)"')
+SCRIPT_RE = re.compile(r'<script\b[^>]*\bsrc="([^"]+)"')
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the bytes of the stylesheets and scripts that pages load, as served. '
+        'Run with DEBUG off after collectstatic to see what production sends.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/', '/products/'], help='Pages to load (default: / and /products/)')
+        parser.add_argument('--accept-encoding', default='br, gzip', help='Accept-Encoding sent for each asset')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        client = Client(SERVER_NAME='localhost')
+        urls = {}
+        for path in options['paths']:
+            response = client.get(path)
+            if response.status_code != 200:
+                raise CommandError(f'GET {path} returned {response.status_code}')
+            html = response.content.decode()
+            for url in STYLESHEET_RE.findall(html) + SCRIPT_RE.findall(html):
+                urls[url] = None
+
+        assets = {url: self.measure(client, url, options['accept_encoding']) for url in urls}
+        report = {
+            'assets': assets,
+            'total_bytes': sum(asset['bytes'] for asset in assets.values() if 'bytes' in asset),
+            'unmeasured': [url for url, asset in assets.items() if 'error' in asset],
+        }
+
+        header = f"{'asset':<60}{'encoding':>10}{'bytes':>10}{'max-age':>12}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for url, asset in assets.items():
+            if 'error' in asset:
+                self.stdout.write(f"{url:<60}  not measured: {asset['error']}")
+            else:
+                self.stdout.write(f"{url:<60}{asset['encoding']:>10}{asset['bytes']:>10}{asset['max_age']:>12}")
+        self.stdout.write(f"{'total':<60}{'':>10}{report['total_bytes']:>10}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            before, after = baseline['total_bytes'], report['total_bytes']
+            change = f' ({(after - before) / before * 100:+.0f}%)' if before else ''
+            self.stdout.write(f'Before: {before} bytes, after: {after} bytes{change}')
+            for url in baseline['unmeasured']:
+                self.stdout.write(f'  Before also loaded {url}, which was not measured')
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def measure(self, client, url, accept_encoding):
+        """Transferred bytes, content encoding and max-age of one asset"""
+        if url.startswith(('http://', 'https://', '//')):
+            request = urllib.request.Request(
+                'https:' + url if url.startswith('//') else url, headers={'Accept-Encoding': accept_encoding}
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=15) as response:
+                    # urllib leaves the body encoded: these are the bytes on the wire
+                    body, headers = response.read(), response.headers
+            except (urllib.error.URLError, OSError) as e:
+                return {'error': str(getattr(e, 'reason', e))}
+        else:
+            response = client.get(url, headers={'Accept-Encoding': accept_encoding})
+            if response.status_code != 200:
+                return {'error': f'status {response.status_code}'}
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            headers = response.headers
+        max_age = MAX_AGE_RE.search(headers.get('Cache-Control') or '')
+        return {
+            'bytes': len(body),
+            'encoding': headers.get('Content-Encoding') or 'identity',
+            'max_age': int(max_age.group(1)) if max_age else 0,
+        }
@@ -0,0 +1,343 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import IsDirectoryError, MissingFileError
+
+from .images import VARIANTS_DIR
+from .routers import REPLICA, replica_reads
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('shop.timing')
+
+REFRESHED_AT_KEY = '_refreshed_at'
+
+session_write_stats = {'refreshed': 0, 'avoided': 0}
+
+
+class SessionRefreshMiddleware:
+    """
+    Sliding session expiry without a write on every request.
+
+    Replaces SESSION_SAVE_EVERY_REQUEST: an unmodified session is only saved
+    (which also re-sends the cookie with a fresh expiry) once less than
+    SESSION_REFRESH_THRESHOLD seconds of its lifetime remain. Must come
+    after SessionMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SESSION_REFRESH_THRESHOLD', settings.SESSION_COOKIE_AGE // 2)
+        self.log_every = getattr(settings, 'SESSION_STATS_LOG_EVERY', 1000)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.refresh(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.refresh(request)
+        return response
+
+    def refresh(self, request):
+        session = getattr(request, 'session', None)
+        if session is None or not session.accessed or session.is_empty():
+            return
+
+        now = int(time.time())
+        if session.modified:
+            # Being saved anyway; restart the clock for free
+            session[REFRESHED_AT_KEY] = now
+            return
+
+        refreshed_at = session.get(REFRESHED_AT_KEY, 0)
+        if settings.SESSION_COOKIE_AGE - (now - refreshed_at) < self.threshold:
+            session[REFRESHED_AT_KEY] = now
+            session_write_stats['refreshed'] += 1
+        else:
+            session_write_stats['avoided'] += 1
+            if session_write_stats['avoided'] % self.log_every == 0:
+                logger.info(
+                    'Session writes avoided: %(avoided)d, expiry refreshes: %(refreshed)d',
+                    session_write_stats,
+                )
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = []
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.template_sql_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries.append((sql, duration))
+            if self.template_depth:
+                self.template_sql_time += duration
+
+
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    # The context variable follows async views into the threads that run
+    # their queries, where a per-request execute_wrapper() would not
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+def _install_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context):
+        metrics = _current_metrics.get()
+        # Only the outermost render is timed; includes are part of it
+        if metrics is None or metrics.template_depth:
+            return render(self, context)
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.template_depth -= 1
+    wrapper.timed = True
+    return wrapper
+
+
+def _fingerprint(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class RequestTimingMiddleware:
+    """
+    Per-request SQL, template and view timings, reported as a Server-Timing header.
+
+    Enabled by REQUEST_TIMING_ENABLED; when off, Django drops the middleware
+    at startup so it costs nothing. Every request logs one JSON line on the
+    'shop.timing' logger; requests slower than REQUEST_TIMING_SLOW_MS also
+    log their most repeated query fingerprints, which is how N+1 patterns
+    show up.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_TIMING_SLOW_MS', 500)
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+        connection_created.connect(_install_recorder)
+        for connection in connections.all(initialized_only=True):
+            _install_recorder(None, connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.report(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.report(request, response, metrics, start)
+
+    def report(self, request, response, metrics, start):
+        total_ms = (time.perf_counter() - start) * 1000
+
+        counts = Counter()
+        durations = defaultdict(float)
+        for sql, duration in metrics.queries:
+            fingerprint = _fingerprint(sql)
+            counts[fingerprint] += 1
+            durations[fingerprint] += duration
+        db_ms = sum(durations.values()) * 1000
+        # Queries run lazily while rendering count as db, not tpl
+        template_ms = (metrics.template_time - metrics.template_sql_time) * 1000
+        view_ms = max(total_ms - template_ms - db_ms, 0.0)
+        duplicates = sum(count - 1 for count in counts.values() if count > 1)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="{len(metrics.queries)} queries, {duplicates} duplicates"',
+            f'tpl;dur={template_ms:.1f}',
+            f'view;dur={view_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': len(metrics.queries),
+            'duplicate_queries': duplicates,
+            'db_ms': round(db_ms, 1),
+            'template_ms': round(template_ms, 1),
+            'view_ms': round(view_ms, 1),
+            'total_ms': round(total_ms, 1),
+        }
+        timing_logger.info(json.dumps(record))
+
+        if total_ms >= self.slow_ms:
+            record['top_queries'] = [
+                {'sql': fingerprint[:300], 'count': count, 'ms': round(durations[fingerprint] * 1000, 1)}
+                for fingerprint, count in counts.most_common(5)
+            ]
+            timing_logger.warning('Slow request: %s', json.dumps(record))
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that also runs natively under ASGI and serves product images.
+
+    A sync-only middleware at the top of the stack would make every ASGI
+    request hop through a thread; static files are answered the same way,
+    everything else is awaited. Files with a content hash in their name
+    are cached for a year rather than WhiteNoise's ten.
+
+    Product images under MEDIA_ROOT (see shop.images) are written while the
+    site runs, so they are looked up on their first request rather than
+    scanned at startup. Their names carry the hash of their content, so a
+    file once found is kept and cached for a year like the static files.
+    """
+
+    sync_capable = True
+    async_capable = True
+    FOREVER = 365 * 24 * 60 * 60
+
+    def __init__(self, get_response=None, settings=settings):
+        self.image_root = os.path.join(os.path.abspath(settings.MEDIA_ROOT), VARIANTS_DIR, '')
+        self.image_prefix = f'{settings.MEDIA_URL}{VARIANTS_DIR}/'
+        super().__init__(get_response, settings=settings)
+        if self.autorefresh:
+            self.add_files(self.image_root, prefix=self.image_prefix)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        static_file = self.find_static_file(request)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        static_file = self.find_static_file(request)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+    def find_static_file(self, request):
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        static_file = self.files.get(request.path_info)
+        if static_file is None and request.path_info.startswith(self.image_prefix):
+            static_file = self.find_image(request.path_info)
+        return static_file
+
+    def find_image(self, url):
+        if not self.url_is_canonical(url):
+            return None
+        try:
+            static_file = self.find_file_at_path(self.image_root + url[len(self.image_prefix):], url)
+        except (IsDirectoryError, MissingFileError):
+            return None
+        self.files[url] = static_file
+        return static_file
+
+    def immutable_file_test(self, path, url):
+        return url.startswith(self.image_prefix) or super().immutable_file_test(path, url)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let catalog reads of safe requests use the read replica (see shop.routers).
+
+    A request with an unsafe method pins the visitor to the primary for
+    REPLICA_STICKY_SECONDS through a short-lived cookie, so whatever they
+    wrote is what they read back while the replica catches up. Django drops
+    the middleware at startup when no replica is configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'primary_pin'
+
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sticky_seconds = settings.REPLICA_STICKY_SECONDS
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self.use_replica(request)):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with replica_reads(self.use_replica(request)):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def use_replica(self, request):
+        return request.method in ('GET', 'HEAD', 'OPTIONS') and self.cookie_name not in request.COOKIES
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                self.cookie_name, '1', max_age=self.sticky_seconds,
+                secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,64 @@
+# Generated by Django 5.0 on 2026-10-17 21:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def merge_duplicate_user_carts(apps, schema_editor):
+    """Fold each user's extra carts into their most recently updated one, summing shared products"""
+    Cart = apps.get_model('shop', 'Cart')
+    CartItem = apps.get_model('shop', 'CartItem')
+    duplicated = (
+        Cart.objects.filter(user__isnull=False)
+        .values('user').annotate(carts=Count('id')).filter(carts__gt=1)
+        .values_list('user', flat=True)
+    )
+    for user_id in duplicated:
+        keep, *extra = Cart.objects.filter(user_id=user_id).order_by('-updated_at', '-id')
+        # product -> the kept cart's line for it
+        lines = dict(CartItem.objects.filter(cart=keep).values_list('product_id', 'pk'))
+        for item in CartItem.objects.filter(cart__in=extra).order_by('-updated_at'):
+            if item.product_id in lines:
+                # Like add_item() and the login merge: quantities add up
+                CartItem.objects.filter(pk=lines[item.product_id]).update(quantity=F('quantity') + item.quantity)
+            else:
+                lines[item.product_id] = item.pk
+                CartItem.objects.filter(pk=item.pk).update(cart=keep)
+        Cart.objects.filter(pk__in=[cart.pk for cart in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_cart_updated_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('session_key__isnull', False)), fields=['session_key'], name='shop_cart_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='shop_order_user_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', '-created_at', '-id'], name='shop_prod_cat_avail_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['-created_at', '-id'], name='shop_prod_avail_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True), ('featured', True)), fields=['-created_at', '-id'], name='shop_prod_featured_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_user_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user',), name='shop_cart_unique_user'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0 on 2026-10-17 22:36
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    """Fill in the counts of existing categories with one UPDATE"""
+    Category = apps.get_model('shop', 'Category')
+    Product = apps.get_model('shop', 'Product')
+
+    def count(**filters):
+        rows = (
+            Product.objects.filter(category=OuterRef('pk'), **filters).order_by()
+            .values('category').annotate(n=Count('pk')).values('n')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Category.objects.update(product_count=count(), available_count=count(available=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,21 @@
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from decimal import Decimal
 
+CENTS = Decimal('0.01')
+
 
 class Category(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField(blank=True)
+    # Maintained by shop.counts as products come, go and change
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    available_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -30,17 +38,47 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.CharField(max_length=200, blank=True, null=True, help_text="Image URL")
+    # Resized copies of image under MEDIA_ROOT, see shop.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     available = models.BooleanField(default=True)
     featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Category pages: available products of one category, newest first
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                name='shop_prod_cat_avail_new_idx',
+                condition=models.Q(available=True),
+            ),
+            # All-products page
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='shop_prod_avail_new_idx',
+                condition=models.Q(available=True),
+            ),
+            # Featured products on the home page
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='shop_prod_featured_idx',
+                condition=models.Q(featured=True, available=True),
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The row as the category counts know it, to diff against on save
+        if 'category_id' in instance.__dict__ and 'available' in instance.__dict__:
+            instance._counted = (instance.category_id, instance.available)
+        return instance
+
     def get_absolute_url(self):
         return reverse('shop:product_detail', args=[self.slug])
 
@@ -50,21 +88,77 @@ class Product(models.Model):
 
 
 class Cart(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Indexed by shop_cart_unique_user below; a second index would only cost writes
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
     session_key = models.CharField(max_length=40, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Range scans for purging idle carts
+            models.Index(fields=['updated_at'], name='shop_cart_updated_idx'),
+            models.Index(
+                fields=['session_key'],
+                name='shop_cart_session_idx',
+                condition=models.Q(session_key__isnull=False),
+            ),
+        ]
+        constraints = [
+            # One cart per registered user, so get_or_create(user=...) cannot race
+            models.UniqueConstraint(fields=['user'], name='shop_cart_unique_user'),
+        ]
+
     def __str__(self):
         return f"Cart {self.id}"
 
+    def touch(self):
+        """Mark the cart as active without saving the whole row"""
+        self.updated_at = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+
+    @cached_property
+    def summary(self):
+        return CartSummary(self.items.with_line_totals())
+
     @property
     def total_price(self):
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.summary.total_price
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.summary.total_items
+
+
+class CartSummary:
+    """Line items and totals of a cart, loaded with a single query"""
+
+    def __init__(self, items):
+        self.items = list(items)
+        for item in self.items:
+            # SQLite computes the line total in floating point
+            item.line_total = item.line_total.quantize(CENTS)
+        self.total_items = sum(item.quantity for item in self.items)
+        self.total_price = sum((item.line_total for item in self.items), Decimal('0.00'))
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_line_totals(self):
+        return self.select_related('product__category').annotate(
+            line_total=ExpressionWrapper(
+                F('quantity') * F('product__price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
 
 
 class CartItem(models.Model):
@@ -74,6 +168,8 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('cart', 'product')
 
@@ -81,6 +177,8 @@ class CartItem(models.Model):
         return f"{self.quantity} x {self.product.name}"
 
     def get_total_price(self):
+        if 'line_total' in self.__dict__:
+            return self.line_total.quantize(CENTS)
         return self.quantity * self.product.price
 
 
@@ -108,6 +206,9 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='shop_order_user_new_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id}"
@@ -0,0 +1,71 @@
+"""
+Read-replica routing for the catalog.
+
+With DATABASE_REPLICA_URL set, Category and Product reads made while serving
+a safe (GET/HEAD) request go to the 'replica' alias. Everything else stays
+on the primary: other models, all writes, reads inside a transaction,
+management commands, and the requests of a visitor who wrote something in
+the last REPLICA_STICKY_SECONDS, so they always see their own changes (see
+ReplicaRoutingMiddleware). A replica that cannot be reached is skipped for
+REPLICA_RETRY_SECONDS and its reads go to the primary meanwhile.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+CATALOG_MODELS = {'shop.category', 'shop.product'}
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+_replica_down_until = 0.0
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Allow (or with enabled=False, forbid) catalog reads from the replica inside the block"""
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_available():
+    global _replica_down_until
+    if time.monotonic() < _replica_down_until:
+        return False
+    try:
+        connections[REPLICA].ensure_connection()
+    except DatabaseError:
+        _replica_down_until = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        logger.warning('Replica unavailable, reading from the primary for %ss', settings.REPLICA_RETRY_SECONDS,
+                       exc_info=True)
+        return False
+    return True
+
+
+class CatalogReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in CATALOG_MODELS or not _use_replica.get():
+            return None
+        # A transaction on the primary must read its own writes
+        if connections['default'].in_atomic_block:
+            return None
+        return REPLICA if replica_available() else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary through replication
+        return db != REPLICA
@@ -0,0 +1,157 @@
+"""
+Full-text product search.
+
+PostgreSQL keeps a weighted ``tsvector`` in ``shop_product.search_vector``
+behind a GIN index. SQLite (local ``db.sqlite3``) keeps an FTS5 table,
+``shop_product_fts``, whose rowid is the product id. Both are created by
+migration 0003 and refreshed from the Product signals; ``manage.py
+rebuild_search_index`` rebuilds them in bulk after raw or ``update()`` writes.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'shop_product_fts'
+
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('{config}', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce(description, '')), 'B')"
+).format(config=SEARCH_CONFIG)
+
+
+def _fts5_query(terms):
+    # Quote each word so user input can never be parsed as FTS5 syntax;
+    # the trailing * gives prefix matching for search-as-you-type.
+    words = re.findall(r'\w+', terms)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _pg_tsquery(terms):
+    # Same words and prefix matching as _fts5_query: \w+ words carry no
+    # tsquery syntax, and :* matches the stemmed word as a prefix.
+    words = re.findall(r'\w+', terms)
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def search_products(queryset, terms):
+    """Filter a Product queryset to rows matching terms, annotated with a rank (higher is better)"""
+    terms = terms.strip()
+    if connection.vendor == 'postgresql':
+        query = _pg_tsquery(terms)
+        if not query:
+            return queryset.none()
+        tsquery = f"to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.filter(
+            RawSQL(f"shop_product.search_vector @@ {tsquery}", [query], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f"ts_rank(shop_product.search_vector, {tsquery})", [query], output_field=FloatField())
+        )
+
+    if connection.vendor == 'sqlite':
+        match = _fts5_query(terms)
+        if not match:
+            return queryset.none()
+        # bm25() is lower-is-better and only valid in the query that does the
+        # MATCH. A lookup that re-ran the MATCH per product would be quadratic
+        # in the hits, so the ranked hits are materialized once and each
+        # product finds its rank there by rowid.
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(
+            rank=RawSQL(
+                f"WITH hits AS MATERIALIZED ("
+                f"SELECT rowid, -bm25({FTS_TABLE}, 10.0, 1.0) AS rank FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s) "
+                f"SELECT rank FROM hits WHERE hits.rowid = shop_product.id",
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    return queryset.filter(
+        Q(name__icontains=terms) | Q(description__icontains=terms)
+    ).annotate(rank=RawSQL('0', [], output_field=FloatField()))
+
+
+def index_product(product):
+    """Refresh the search index entry of a single product"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"UPDATE shop_product SET search_vector = {PG_VECTOR_SQL} WHERE id = %s",
+                [product.pk],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+                [product.pk, product.name, product.description],
+            )
+
+
+def index_products(pks):
+    """Refresh the search index entries of many products with set-based statements"""
+    pks = list(pks)
+    if not pks:
+        return
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"UPDATE shop_product SET search_vector = {PG_VECTOR_SQL} WHERE id IN ({placeholders})",
+                pks,
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", pks)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+                f"SELECT id, name, description FROM shop_product WHERE id IN ({placeholders})",
+                pks,
+            )
+
+
+def unindex_product(pk):
+    # The PostgreSQL vector lives on the product row and goes away with it
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+def rebuild_index(batch_size=5000):
+    """Rebuild the whole index in primary-key ranges, yielding the number of rows in each batch"""
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(id), MAX(id) FROM shop_product")
+        low, high = cursor.fetchone()
+        if connection.vendor == 'sqlite':
+            # Entries no range below covers belong to no product
+            if low is None:
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            else:
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid < %s OR rowid > %s", [low, high])
+        if low is None:
+            return
+
+        for start in range(low, high + 1, batch_size):
+            end = start + batch_size
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"UPDATE shop_product SET search_vector = {PG_VECTOR_SQL} "
+                    "WHERE id >= %s AND id < %s",
+                    [start, end],
+                )
+            else:
+                # One range is swapped at a time, so searches never see the
+                # index empty, and a failure leaves every range whole
+                with transaction.atomic():
+                    cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid >= %s AND rowid < %s", [start, end])
+                    cursor.execute(
+                        f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+                        "SELECT id, name, description FROM shop_product WHERE id >= %s AND id < %s",
+                        [start, end],
+                    )
+            yield cursor.rowcount
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import search
+from .cart import merge_session_cart
+from .catalog_cache import bump_catalog_version
+from .counts import CountDeltas, product_state
+from .models import Category, Product
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search_index(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+def load_counted_state(sender, instance, raw=False, **kwargs):
+    # Instances not loaded whole (built by hand, or with deferred fields)
+    # don't know what the counts hold for their row
+    if not raw and instance.pk is not None and not hasattr(instance, '_counted'):
+        row = Product.objects.filter(pk=instance.pk).values_list('category_id', 'available').first()
+        instance._counted = row and tuple(row)
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'category', 'category_id', 'available'} & set(update_fields):
+        return
+    new = product_state(instance)
+    deltas = CountDeltas()
+    deltas.change(None if created else getattr(instance, '_counted', None), new)
+    deltas.apply()
+    instance._counted = new
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_category_counts(sender, instance, **kwargs):
+    deltas = CountDeltas()
+    deltas.change(getattr(instance, '_counted', None) or product_state(instance), None)
+    deltas.apply()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    # login() has already cycled the session key; the request's cookie still holds the old one
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME) if request is not None else None
+    if session_key:
+        merge_session_cart(session_key, user)
+    if hasattr(request, '_cart'):
+        del request._cart
@@ -117,6 +117,27 @@ function initializeCartUpdates() {
         });
     });
 
+    // Cart page: change quantities and remove lines in place
+    document.querySelectorAll('form[data-cart-ajax]').forEach(form => {
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            fetch(this.action, {
+                method: 'POST',
+                body: new FormData(this),
+                headers: { 'Accept': 'application/json' },
+                credentials: 'same-origin'
+            })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(applyCartDelta)
+                .catch(() => form.submit());
+        });
+    });
+
     // Quantity selector enhancements
     const quantitySelects = document.querySelectorAll('select[name="quantity"]');
     quantitySelects.forEach(select => {
@@ -130,6 +151,35 @@ function initializeCartUpdates() {
     });
 }
 
+// Apply a cart change returned by cart_add/cart_remove as JSON
+function applyCartDelta(delta) {
+    const line = document.querySelector(`[data-cart-line="${delta.line.product}"]`);
+    if (line) {
+        if (delta.line.quantity > 0) {
+            line.querySelector('[data-line-total]').textContent = '$' + delta.line.line_total;
+        } else {
+            line.remove();
+        }
+    }
+
+    if (delta.cart_count === 0 && document.querySelector('[data-cart-subtotal]')) {
+        // Show the empty cart page
+        window.location.reload();
+        return;
+    }
+
+    document.querySelectorAll('[data-cart-count]').forEach(el => {
+        el.textContent = delta.cart_count;
+    });
+    document.querySelectorAll('[data-cart-subtotal]').forEach(el => {
+        el.textContent = '$' + delta.subtotal;
+    });
+    document.querySelectorAll('[data-cart-badge]').forEach(badge => {
+        badge.textContent = delta.cart_count;
+        badge.classList.toggle('hidden', delta.cart_count === 0);
+    });
+}
+
 // Form validation enhancements
 function initializeFormValidation() {
     const forms = document.querySelectorAll('form');
@@ -238,7 +288,7 @@ function initializeImageZoom() {
 function showImageModal(src, alt) {
     // Create modal overlay
     const overlay = document.createElement('div');
-    overlay.className = 'fixed inset-0 bg-black bg-opacity-75 flex items-center justify-center z-50';
+    overlay.className = 'fixed inset-0 bg-black/75 flex items-center justify-center z-50';
     overlay.style.cursor = 'zoom-out';
 
     // Create image container
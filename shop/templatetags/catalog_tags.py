@@ -0,0 +1,69 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from shop import catalog_cache, images
+
+register = template.Library()
+
+
+class CatalogCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        parts = [var.resolve(context) for var in self.vary_on]
+        return catalog_cache.get_or_build(
+            f'fragment:{self.name}', lambda: self.nodelist.render(context), *parts
+        )
+
+
+@register.tag('catalog_cache')
+def do_catalog_cache(parser, token):
+    """
+    Cache a rendered catalog fragment until the catalog changes.
+
+    Usage::
+
+        {% catalog_cache "product_grid" category.slug cursor %}
+            ...
+        {% endcatalog_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endcatalog_cache',))
+    parser.delete_first_token()
+    name = bits[1].strip('"\'')
+    return CatalogCacheNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
+
+
+@register.simple_tag
+def product_image(product, sizes='100vw', **attrs):
+    """
+    A <picture> of the product's image variants for the given sizes, or a
+    plain <img> of product.image until they are built.
+
+    Usage::
+
+        {% product_image product sizes="(min-width: 768px) 50vw, 100vw" class="w-full" %}
+    """
+    attrs = {'alt': product.name, 'loading': 'lazy', 'decoding': 'async', **attrs}
+    variants = images.current_variants(product)
+    if variants is None:
+        return format_html('<img src="{}"{}>', product.image, flatatt(attrs))
+
+    def srcset(fmt):
+        return ', '.join(f'{images.variant_url(variants, width, fmt)} {width}w' for width in variants['widths'])
+
+    # For the few browsers without srcset; big enough for a product card
+    fallback = next((width for width in variants['widths'] if width >= 384), variants['widths'][-1])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{}></picture>',
+        srcset('webp'), sizes,
+        images.variant_url(variants, fallback, 'jpeg'), srcset('jpeg'), sizes,
+        variants['width'], variants['height'], flatatt(attrs),
+    )
@@ -1,19 +1,33 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, async_views, views
 
 app_name = 'shop'
 
+# Read-heavy catalog pages are served by their async versions under ASGI
+catalog_views = async_views if settings.SERVER_MODE == 'asgi' else views
+
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('products/', views.product_list, name='product_list'),
-    path('products/<slug:category_slug>/', views.product_list, name='product_list_by_category'),
-    path('product/<slug:slug>/', views.product_detail, name='product_detail'),
-    path('cart/', views.cart_detail, name='cart_detail'),
+    path('', catalog_views.home, name='home'),
+    path('products/', catalog_views.product_list, name='product_list'),
+    path('products/<slug:category_slug>/', catalog_views.product_list, name='product_list_by_category'),
+    path('search/', views.search, name='search'),
+    path('product/<slug:slug>/', catalog_views.product_detail, name='product_detail'),
+    path('cart/', catalog_views.cart_detail, name='cart_detail'),
     path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'),
     path('cart/remove/<int:product_id>/', views.cart_remove, name='cart_remove'),
     path('order/create/', views.order_create, name='order_create'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
+    path('export/orders/', views.order_export, name='order_export'),
+    path('export/products/', views.product_export, name='product_export'),
+    path('ops/db-pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('api/categories/', api.categories, name='api_categories'),
+    path('api/products/', api.products, name='api_products'),
+    path('api/products/<slug:slug>/', api.product, name='api_product'),
+    path('api/cart/', api.cart, name='api_cart'),
+    path('api/cart/items/', api.cart_add, name='api_cart_add'),
+    path('api/cart/items/<int:product_id>/', api.cart_remove, name='api_cart_remove'),
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', views.logout_view, name='logout'),
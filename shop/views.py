@@ -1,17 +1,35 @@
+from decimal import Decimal
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import UserCreationForm
-from .models import Category, Product, Cart, CartItem, Order, OrderItem
+from .models import Category, Product, Order
 from .forms import CartAddProductForm, OrderCreateForm
+from .cart import CENTS, add_item, cart_totals, get_cart, remove_item
+from .catalog_cache import get_or_build
+from .checkout import CheckoutError, place_order
+from .conditional import conditional_page, listing_validator, product_validator
+from .export import ExportError, export_orders, export_products
+from .pagination import KeysetPaginator, normalize_cursor
+from .search import search_products
+
+PRODUCTS_PER_PAGE = 12
 
 
+@conditional_page(listing_validator)
 def home(request):
-    featured_products = Product.objects.filter(featured=True, available=True)[:6]
-    categories = Category.objects.all()[:6]
+    featured_products = get_or_build(
+        'featured_products',
+        lambda: list(Product.objects.filter(featured=True, available=True)[:6]),
+    )
+    categories = get_or_build('home_categories', lambda: list(Category.objects.all()[:6]))
     context = {
         'featured_products': featured_products,
         'categories': categories,
@@ -19,25 +37,74 @@ def home(request):
     return render(request, 'shop/home.html', context)
 
 
+@conditional_page(listing_validator)
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
+    categories = get_or_build('categories', lambda: list(Category.objects.all()))
     products = Product.objects.filter(available=True)
 
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
+        category = get_or_build(
+            'category', lambda: Category.objects.filter(slug=category_slug).first(), category_slug
+        )
+        if category is None:
+            raise Http404('No Category matches the given query.')
         products = products.filter(category=category)
 
+    cursor = normalize_cursor(request.GET.get('cursor'))
+    page = get_or_build(
+        'product_page',
+        lambda: KeysetPaginator(products, per_page=PRODUCTS_PER_PAGE).get_page(cursor),
+        category_slug,
+        cursor,
+    )
+
     context = {
         'category': category,
         'categories': categories,
-        'products': products,
+        # Stored counts: the sidebar costs no query per category
+        'available_total': sum(c.available_count for c in categories),
+        'products': page,
+        'page': page,
+        'cursor': cursor,
     }
     return render(request, 'shop/product/list.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    category_slug = request.GET.get('category', '')
+    categories = Category.objects.all()
+    category = None
+    page = None
+
+    if query:
+        products = Product.objects.filter(available=True)
+        if category_slug:
+            category = get_object_or_404(Category, slug=category_slug)
+            products = products.filter(category=category)
+        products = search_products(products, query).order_by('-rank', '-id')
+        page = Paginator(products, PRODUCTS_PER_PAGE).get_page(request.GET.get('page'))
+
+    context = {
+        'query': query,
+        'category': category,
+        'categories': categories,
+        'page': page,
+    }
+    return render(request, 'shop/product/search.html', context)
+
+
+@conditional_page(product_validator, shared=False)
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, available=True)
+    product = get_or_build(
+        'product',
+        lambda: Product.objects.select_related('category').filter(slug=slug, available=True).first(),
+        slug,
+        stock_of=slug,
+    )
+    if product is None:
+        raise Http404('No Product matches the given query.')
     cart_product_form = CartAddProductForm()
     context = {
         'product': product,
@@ -46,52 +113,52 @@ def product_detail(request, slug):
     return render(request, 'shop/product/detail.html', context)
 
 
-def get_cart(request):
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+def wants_json(request):
+    """Whether the client asked for JSON, like the cart page's script, rather than a page"""
+    return request.accepts('application/json') and not request.accepts('text/html')
+
+
+def cart_delta(cart, product, quantity):
+    """The changed line, the new subtotal and the badge count, for updating the cart page in place"""
+    count, subtotal = cart_totals(cart) if cart is not None else (0, Decimal('0.00'))
+    return JsonResponse({
+        'line': {
+            'product': product.pk,
+            'quantity': quantity,
+            'line_total': (product.price * quantity).quantize(CENTS),
+        },
+        'subtotal': subtotal,
+        'cart_count': count,
+    })
 
 
 @require_POST
 def cart_add(request, product_id):
-    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     form = CartAddProductForm(request.POST)
 
     if form.is_valid():
         cd = form.cleaned_data
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': cd['quantity']}
-        )
-        if not created:
-            if cd['override']:
-                cart_item.quantity = cd['quantity']
-            else:
-                cart_item.quantity += cd['quantity']
-        cart_item.save()
+        cart = get_cart(request).persist()
+        quantity = add_item(cart, product, cd['quantity'], cd['override'])
+        if wants_json(request):
+            return cart_delta(cart, product, quantity)
         messages.success(request, f'{product.name} added to cart!')
+    elif wants_json(request):
+        return JsonResponse({'error': 'Invalid cart line', 'fields': form.errors.get_json_data()}, status=400)
 
     return redirect('shop:cart_detail')
 
 
 @require_POST
 def cart_remove(request, product_id):
-    cart = get_cart(request)
+    cart = get_cart(request).instance
     product = get_object_or_404(Product, id=product_id)
-    try:
-        cart_item = CartItem.objects.get(cart=cart, product=product)
-        cart_item.delete()
+    removed = cart is not None and remove_item(cart, product)
+    if wants_json(request):
+        return cart_delta(cart, product, 0)
+    if removed:
         messages.success(request, f'{product.name} removed from cart!')
-    except CartItem.DoesNotExist:
-        pass
     return redirect('shop:cart_detail')
 
 
@@ -111,18 +178,12 @@ def order_create(request):
         if form.is_valid():
             order = form.save(commit=False)
             order.user = request.user
-            order.total_amount = cart.total_price
-            order.save()
-
-            for item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    price=item.product.price,
-                    quantity=item.quantity
-                )
-
-            cart.items.all().delete()
+            try:
+                place_order(order, cart.instance)
+            except CheckoutError as e:
+                messages.error(request, str(e))
+                return redirect('shop:cart_detail')
+
             messages.success(request, f'Your order #{order.id} has been created successfully!')
             return redirect('shop:order_detail', order_id=order.id)
     else:
@@ -144,6 +205,32 @@ def order_detail(request, order_id):
     return render(request, 'shop/order/detail.html', context)
 
 
+@staff_member_required
+def order_export(request):
+    try:
+        return export_orders(request.GET)
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+@staff_member_required
+def product_export(request):
+    try:
+        return export_products(request.GET)
+    except ExportError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+@staff_member_required
+def db_pool_stats(request):
+    """Connection pool counters of the worker process that serves the request"""
+    try:
+        from .backends.postgresql_pool.base import pool_stats
+    except ImproperlyConfigured:
+        return JsonResponse({})
+    return JsonResponse(pool_stats())
+
+
 def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
@@ -13,6 +13,7 @@ django.setup()
 
 from django.db import connection
 from django.contrib.auth.models import User
+from shop import counts
 from shop.models import Category, Product
 
 def verify_database_connection():
@@ -45,10 +46,13 @@ def verify_database_connection():
         print(f"   • Products: {Product.objects.count()}")
         print(f"   • Featured Products: {Product.objects.filter(featured=True).count()}")
 
-        # Show categories
+        # Show categories, with the counts stored on them
         print(f"\n📁 CATEGORIES:")
         for cat in Category.objects.all():
-            print(f"   • {cat.name} ({cat.products.count()} products)")
+            print(f"   • {cat.name} ({cat.product_count} products, {cat.available_count} available)")
+        drifted = counts.reconcile(dry_run=True)
+        if drifted:
+            print(f"   ⚠️  {len(drifted)} categories have drifted counts; run manage.py reconcile_category_counts")
 
         # Show featured products
         print(f"\n⭐ FEATURED PRODUCTS:")